@@ -0,0 +1,103 @@
+"""Numba kernels for the status engine's per-node feature math.
+
+numba is optional: NUMBA_AVAILABLE is False without it and status_engine keeps
+its NumPy implementation. The kernels mirror that implementation exactly,
+including NaN handling, so they are compiled without fastmath.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional; callers check NUMBA_AVAILABLE
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True)
+def median_nb(vals):
+    """Median of a 1-D array without NaN (quickselect via np.partition)."""
+    n = vals.shape[0]
+    k = n // 2
+    part = np.partition(vals, k)
+    if n % 2 == 1:
+        return part[k]
+    # The k smallest values sit before index k; the largest of them is rank k-1
+    return (part[:k].max() + part[k]) / 2.0
+
+
+@njit(cache=True)
+def mad_nb(vals, med):
+    return median_nb(np.abs(vals - med))
+
+
+@njit(cache=True)
+def features_nb(mat, x_row, window):
+    """z-scores, trend slopes and abnormal count for a (rows, features) history.
+
+    Same rules as status_engine._z_vector/_slope_vector: NaN marks a missing
+    value, z is 0 with fewer than five values or no current value, and slopes
+    pair the window's present values with x = 0, 1, ... in order.
+    """
+    n_rows, n_feats = mat.shape
+    z = np.zeros(n_feats)
+    slopes = np.zeros(n_feats)
+    buf = np.empty(n_rows)
+
+    win_start = max(n_rows - window, 0)
+    win_len = n_rows - win_start
+    x_mean = (win_len - 1) / 2.0
+    x_var = 0.0
+    for i in range(win_len):
+        x_var += (i - x_mean) ** 2
+    if x_var == 0.0:
+        x_var = 1e-6
+
+    abnormal = 0
+    for j in range(n_feats):
+        count = 0
+        for i in range(n_rows):
+            v = mat[i, j]
+            if not np.isnan(v):
+                buf[count] = v
+                count += 1
+        cur = x_row[j]
+        if count >= 5 and not np.isnan(cur):
+            vals = buf[:count]
+            med = median_nb(vals)
+            mad = mad_nb(vals, med)
+            if mad > 0:
+                scale = mad * 1.4826
+            else:
+                sq = 0.0
+                for i in range(count):
+                    sq += (vals[i] - med) ** 2
+                scale = np.sqrt(sq / count)
+                if scale == 0.0:
+                    scale = 1e-6
+            z[j] = (cur - med) / scale
+            if abs(z[j]) >= 2.5:
+                abnormal += 1
+
+        if n_rows >= 2:
+            ys_count = 0
+            y_sum = 0.0
+            for i in range(win_start, n_rows):
+                v = mat[i, j]
+                if not np.isnan(v):
+                    buf[ys_count] = v
+                    y_sum += v
+                    ys_count += 1
+            if ys_count >= 2:
+                y_mean = y_sum / ys_count
+                cov = 0.0
+                for i in range(ys_count):
+                    cov += (i - x_mean) * (buf[i] - y_mean)
+                slopes[j] = cov / x_var
+    return z, slopes, abnormal
@@ -1,9 +1,22 @@
+import heapq
 import math
+import threading
+import warnings
+from collections import deque
+from functools import lru_cache
 import joblib
 import numpy as np
 from pathlib import Path
 from datetime import datetime
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the scoring core runs as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
 HERE = Path(__file__).parent
 GROUND_MODEL_PATH = HERE / "isoforest_ground.pkl"
 WATER_MODEL_PATH = HERE / "isoforest_water.pkl"
@@ -30,6 +43,18 @@ HARD_THRESHOLDS = {
     },
 }
 
+def _compile_thresholds(thresholds):
+    """Align each node type's limits into per-kind arrays; NaN marks an absent limit."""
+    compiled = {}
+    for node_type, th in thresholds.items():
+        feats = list(th)
+        compiled[node_type] = {"feats": feats}
+        for key in ("danger_high", "danger_low", "warning_high", "warning_low"):
+            compiled[node_type][key] = np.array([th[f].get(key, np.nan) for f in feats], dtype=float)
+    return compiled
+
+_HARD = _compile_thresholds(HARD_THRESHOLDS)
+
 # Sudden jump multipliers for rate-of-change detection
 JUMP_RULES = {
     "radiation_cpm": {"warn_mult": 5.0, "danger_mult": 10.0, "warn_floor": 120},
@@ -39,61 +64,213 @@ JUMP_RULES = {
     "turbidity": {"warn_mult": 2.5, "danger_mult": 4.0, "warn_floor": 15},
 }
 
+@lru_cache(maxsize=2)
+def _load_model_cached(path_str, mtime):
+    return joblib.load(path_str)
+
+def _load_model(path):
+    """Return the pickled model at path, loading it once per file version."""
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    return _load_model_cached(str(path), mtime)
+
+@njit(cache=True, fastmath=True)
 def _sigmoid(x: float) -> float:
-    return 1 / (1 + math.exp(-x))
-
-def _robust_stats(values):
-    """Return median and MAD (with fallback to std if needed)."""
-    arr = np.array(values, dtype=float)
-    med = float(np.median(arr))
-    mad = float(np.median(np.abs(arr - med)))
-    if mad == 0:
-        std = float(np.std(arr)) or 1e-6
-        return med, std, True
-    return med, mad, False
-
-def _z_scores(reading, history, features):
-    zs = {}
-    for feat in features:
-        vals = [row[feat] for row in history if row.get(feat) is not None]
-        if len(vals) < 3 or reading.get(feat) is None:
-            zs[feat] = 0.0
-            continue
-        med, spread, used_std = _robust_stats(vals)
-        scale = spread * (1 if used_std else 1.4826)
-        scale = scale if scale != 0 else 1e-6
-        zs[feat] = float((reading[feat] - med) / scale)
-    return zs
+    # tanh form: one libm call and no exp overflow for large |x|
+    return 0.5 + 0.5 * math.tanh(0.5 * x)
+
+def _history_matrix(history, features):
+    """Pack history into an (H, F) float64 array, NaN where a value is missing."""
+    mat = np.array(
+        [[np.nan if row.get(f) is None else row[f] for f in features] for row in history],
+        dtype=np.float64,
+    )
+    return mat.reshape(len(history), len(features))
+
+def _partition_medians(buf, counts):
+    """Per-column median of buf ignoring NaN, using O(N) selection instead of a sort.
+
+    Partitions buf in place; NaN sorts to the end so each column's values occupy
+    its first counts[j] rows.
+    """
+    lo = np.maximum(counts - 1, 0) // 2
+    hi = counts // 2
+    kth = np.unique(np.concatenate([lo, hi]))
+    buf.partition(kth[kth < buf.shape[0]], axis=0)
+    cols = np.arange(buf.shape[1])
+    return 0.5 * (buf[lo, cols] + buf[np.minimum(hi, buf.shape[0] - 1), cols])
+
+def _z_scores(reading, history, features, hist_matrix=None):
+    """Robust z-scores for all features in one columnwise median/MAD pass."""
+    mat = _history_matrix(history, features) if hist_matrix is None else hist_matrix
+    return dict(zip(features, _z_vector(reading, features, mat).tolist()))
+
+def _z_vector(reading, features, mat):
+    if mat.shape[0] == 0:
+        return np.zeros(len(features))
+    # float64 even for float32 input (db.get_history_matrix): z-scores are ranked
+    # against each other, and float32 rounding reorders near-ties
+    mat = np.asarray(mat, dtype=np.float64)
+    vec = np.array([np.nan if reading.get(f) is None else reading[f] for f in features], dtype=np.float64)
+    counts = np.count_nonzero(~np.isnan(mat), axis=0)
+    buf = mat.copy()
+    med = _partition_medians(buf, counts)
+    # MAD reuses the same buffer: |x - med| in place, then select again
+    np.subtract(buf, med, out=buf)
+    np.abs(buf, out=buf)
+    mad = _partition_medians(buf, counts)
+    std = np.zeros_like(mad)
+    if np.any(mad == 0):
+        with warnings.catch_warnings():
+            # All-NaN columns are expected for sparse features; they are masked below
+            warnings.simplefilter("ignore", RuntimeWarning)
+            std = np.nanstd(mat, axis=0)
+    scale = np.where(mad == 0, np.where(std == 0, 1e-6, std), mad * 1.4826)
+    valid = (counts >= 3) & ~np.isnan(vec)
+    return np.where(valid, (vec - med) / np.where(valid, scale, 1.0), 0.0)
 
 def _iso_probability(model, features, reading):
-    vector = [reading.get(f, 0.0) for f in features]
+    return _iso_probabilities(model, features, [reading])[0]
+
+def _iso_probabilities(model, features, readings):
+    """Score many readings with a single score_samples call; incomplete rows score 0.0."""
+    probs = [0.0] * len(readings)
+    rows = []
+    idx = []
+    for i, reading in enumerate(readings):
+        vector = [reading.get(f, 0.0) for f in features]
+        if any(v is None for v in vector):
+            continue
+        rows.append(vector)
+        idx.append(i)
+    if not rows:
+        return probs
     try:
-        score = model.score_samples([vector])[0]
+        scores = model.score_samples(np.asarray(rows, dtype=np.float32))
     except Exception:
-        return 0.0
+        return probs
     # Lower score = more anomalous; invert and squash
-    return float(_sigmoid(-score))
-
-def _stability_factor(history, feat_list, window=50):
-    vals = []
-    for row in history[-window:]:
-        for feat in feat_list:
-            v = row.get(feat)
-            if v is not None:
-                vals.append(v)
-    if len(vals) < 5:
-        return 1.0
-    arr = np.array(vals, dtype=float)
-    mean = np.mean(arr)
-    spread = np.std(arr)
-    if mean == 0:
-        return 1.0
-    cv = abs(spread / mean)
-    if cv < 0.05:
-        return 1.0
-    if cv > 0.5:
-        return 0.3
-    return max(0.3, 1.0 - cv)
+    for i, score in zip(idx, scores):
+        probs[i] = float(_sigmoid(-score))
+    return probs
+
+def score_nodes(readings):
+    """Batch IsolationForest scoring for {node_id: reading}; one call per model.
+
+    Returns {node_id: iso_prob} for nodes whose model is available, suitable for
+    passing to predict_node via context["iso_prob"].
+    """
+    groups = {"ground": [], "water": []}
+    for node_id, reading in readings.items():
+        if reading:
+            groups["ground" if node_id.startswith("ground") else "water"].append((node_id, reading))
+    result = {}
+    for node_type, items in groups.items():
+        if not items:
+            continue
+        model_path = GROUND_MODEL_PATH if node_type == "ground" else WATER_MODEL_PATH
+        try:
+            model = _load_model(model_path)
+        except Exception:
+            model = None
+        if model is None:
+            continue
+        features = GROUND_FEATURES if node_type == "ground" else WATER_FEATURES
+        probs = _iso_probabilities(model, features, [r for _, r in items])
+        result.update({node_id: p for (node_id, _), p in zip(items, probs)})
+    return result
+
+class StabilityAccumulator:
+    """Running count/sum/sum-of-squares over the last `window` history rows.
+
+    Totals are adjusted as rows enter and leave, and re-summed from the per-row
+    totals once per `window` pushes so rounding error can't build up.
+    """
+
+    def __init__(self, window=50):
+        self._rows = deque(maxlen=window)
+        self._since_resync = 0
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def last_key(self):
+        return self._rows[-1][0] if self._rows else None
+
+    def _resync(self):
+        self.n = sum(n for _, n, _, _ in self._rows)
+        self.total = math.fsum(total for _, _, total, _ in self._rows)
+        self.total_sq = math.fsum(total_sq for _, _, _, total_sq in self._rows)
+        self._since_resync = 0
+
+    def push(self, key, row, feat_list):
+        if len(self._rows) == self._rows.maxlen:
+            _, n, total, total_sq = self._rows[0]
+            self.n -= n
+            self.total -= total
+            self.total_sq -= total_sq
+        vals = [v for v in (row.get(f) for f in feat_list) if v is not None]
+        n = len(vals)
+        total = math.fsum(vals)
+        total_sq = math.fsum(v * v for v in vals)
+        self._rows.append((key, n, total, total_sq))
+        self.n += n
+        self.total += total
+        self.total_sq += total_sq
+        self._since_resync += 1
+        if self._since_resync >= self._rows.maxlen:
+            self._resync()
+
+    def factor(self):
+        if self.n < 5:
+            return 1.0
+        mean = self.total / self.n
+        if mean == 0:
+            return 1.0
+        spread = math.sqrt(max(0.0, self.total_sq / self.n - mean * mean))
+        cv = abs(spread / mean)
+        if cv < 0.05:
+            return 1.0
+        if cv > 0.5:
+            return 0.3
+        return max(0.3, 1.0 - cv)
+
+    @classmethod
+    def from_history(cls, history, feat_list, window=50):
+        acc = cls(window)
+        for row in history[-window:]:
+            acc.push(row.get("id"), row, feat_list)
+        return acc
+
+
+# Per-node accumulators, advanced by one row per call when history has only grown by one
+_STABILITY = {}
+_STABILITY_LOCK = threading.Lock()
+
+def _stability_factor(history, feat_list, window=50, node_id=None):
+    if node_id is None or not history or history[-1].get("id") is None:
+        return StabilityAccumulator.from_history(history, feat_list, window).factor()
+    key = (node_id, tuple(feat_list), window)
+    last_id = history[-1]["id"]
+    with _STABILITY_LOCK:
+        acc = _STABILITY.get(key)
+        if acc is None or acc.last_key is None:
+            acc = _STABILITY[key] = StabilityAccumulator.from_history(history, feat_list, window)
+        elif acc.last_key != last_id:
+            # Push only if history grew by exactly this row: a shorter window (or a
+            # restart) must not keep rows that have left it
+            grown = len(acc) + (len(acc) < window)
+            if len(history) >= 2 and history[-2].get("id") == acc.last_key and grown == min(len(history), window):
+                acc.push(last_id, history[-1], feat_list)
+            else:
+                acc = _STABILITY[key] = StabilityAccumulator.from_history(history, feat_list, window)
+        return acc.factor()
 
 def _human_summary(node_id, status, reasons):
     if status == "Offline":
@@ -107,29 +284,37 @@ def _check_hard_limits(reading, node_type):
     """Fail-safe guard: immediate danger if absolute thresholds exceeded."""
     reasons = []
     flagged = []
-    warn_hit = False
-    danger_hit = False
     warn_features = set()
     th = HARD_THRESHOLDS[node_type]
-    for feat, limits in th.items():
-        val = reading.get(feat)
-        if val is None:
-            continue
-        if "danger_high" in limits and val >= limits["danger_high"]:
-            danger_hit = True
+    hard = _HARD[node_type]
+    feats = hard["feats"]
+    vals = np.fromiter(
+        (np.nan if reading.get(f) is None else reading[f] for f in feats),
+        dtype=float,
+        count=len(feats),
+    )
+    # NaN (missing value or absent limit) never compares true
+    danger_high = vals >= hard["danger_high"]
+    danger_low = vals <= hard["danger_low"]
+    warning_high = vals >= hard["warning_high"]
+    warning_low = vals <= hard["warning_low"]
+    danger_hit = bool(danger_high.any() or danger_low.any())
+    warn_hit = bool(warning_high.any() or warning_low.any())
+    for i in np.flatnonzero(danger_high | danger_low | warning_high | warning_low):
+        feat = feats[i]
+        val = reading[feat]
+        limits = th[feat]
+        if danger_high[i]:
             reasons.append(f"Absolute threshold exceeded: {feat} {val} >= {limits['danger_high']}")
             flagged.append({"feature": feat, "value": val, "threshold": limits["danger_high"], "direction": "high"})
-        if "danger_low" in limits and val <= limits["danger_low"]:
-            danger_hit = True
+        if danger_low[i]:
             reasons.append(f"Absolute threshold exceeded: {feat} {val} <= {limits['danger_low']}")
             flagged.append({"feature": feat, "value": val, "threshold": limits["danger_low"], "direction": "low"})
-        if "warning_high" in limits and val >= limits["warning_high"]:
-            warn_hit = True
+        if warning_high[i]:
             warn_features.add(feat)
             reasons.append(f"High reading: {feat} {val} >= {limits['warning_high']}")
             flagged.append({"feature": feat, "value": val, "threshold": limits["warning_high"], "direction": "high"})
-        if "warning_low" in limits and val <= limits["warning_low"]:
-            warn_hit = True
+        if warning_low[i]:
             warn_features.add(feat)
             reasons.append(f"Low reading: {feat} {val} <= {limits['warning_low']}")
             flagged.append({"feature": feat, "value": val, "threshold": limits["warning_low"], "direction": "low"})
@@ -159,15 +344,74 @@ def _check_jumps(reading, prev):
             flagged.append({"feature": feat, "prev": old_val, "curr": new_val, "ratio": ratio, "type": "trend"})
     return reasons, warn_hit, danger_hit, flagged
 
+# Probability at which the status is Danger regardless of other layers
+DANGER_PROB = 0.7
+
+@njit(cache=True, fastmath=True)
+def _baseline_probability(z_vec, baseline_scale):
+    z_max = 0.0
+    for z in z_vec:
+        z_max = max(z_max, abs(z))
+    return _sigmoid((z_max - 2.0) * 1.4) * baseline_scale
+
+@njit(cache=True, fastmath=True)
+def _score_core(z_vec, warn_feature_count, warn_hard, danger_hard, jump_warn, jump_danger,
+                iso_prob, baseline_prob, history_len):
+    """Numeric core of predict_node: combine layer outputs into a probability.
+
+    Returns (abnormal_probability, warn_hit, danger_hit, abnormal_count).
+    """
+    abnormal_count = warn_feature_count
+    for z in z_vec:
+        if abs(z) >= 2.5:
+            abnormal_count += 1
+
+    jump_boost = 0.0
+    if jump_danger:
+        jump_boost = 0.85
+    elif jump_warn:
+        jump_boost = 0.5
+    prob = max(baseline_prob, iso_prob, jump_boost)
+
+    # Multi-sensor bump
+    warn_hit = warn_hard or jump_warn
+    danger_hit = jump_danger
+    if abnormal_count >= 3:
+        prob = min(1.0, prob + 0.25)
+    elif abnormal_count >= 2:
+        prob = min(1.0, prob + 0.15)
+
+    # Enforce probability floors when clear warning/danger cues exist
+    if danger_hit:
+        prob = max(prob, 0.8)
+    if warn_hit:
+        prob = max(prob, 0.5)
+    if danger_hard:
+        prob = max(prob, 0.99)
+        danger_hit = True
+
+    # Low-history fail-safe: enforce warning/danger if thresholds hit
+    if history_len < 30:
+        if warn_hard:
+            prob = max(prob, 0.5)
+            warn_hit = True
+        if danger_hit:
+            prob = max(prob, 0.8)
+    return prob, warn_hit, danger_hit, abnormal_count
+
 def _status_from_prob(p, warn_forced=False, danger_forced=False):
-    if danger_forced or p >= 0.7:
+    if danger_forced or p >= DANGER_PROB:
         return "Danger"
     if warn_forced or p >= 0.35:
         return "Warning"
     return "Safe"
 
 def predict_node(reading, history, node_id, context=None):
-    """Combine physics-based limits + jumps + robust baseline for explainable anomaly scoring."""
+    """Combine physics-based limits + jumps + robust baseline for explainable anomaly scoring.
+
+    context may carry "iso_prob" (from score_nodes) and "history_matrix" (from
+    db.get_history_matrix) to skip recomputing them here.
+    """
     node_type = "ground" if node_id.startswith("ground") else "water"
     features = GROUND_FEATURES if node_type == "ground" else WATER_FEATURES
     history_len = len(history)
@@ -176,7 +420,7 @@ def predict_node(reading, history, node_id, context=None):
 
     # Confidence = history factor * stability factor
     base_history_factor = min(1.0, history_len / 200.0)
-    stability_factor = _stability_factor(history, features, window=50)
+    stability_factor = _stability_factor(history, features, window=50, node_id=node_id)
     confidence = max(0.05, min(1.0, base_history_factor * stability_factor))
     if history_len < 30:
         confidence = min(confidence, 0.4)
@@ -186,63 +430,50 @@ def predict_node(reading, history, node_id, context=None):
 
     # Layer B1: rate-of-change checks
     jump_reasons, jump_warn, jump_danger, jump_flagged = _check_jumps(reading, prev)
-    jump_boost = 0.0
-    if jump_danger:
-        jump_boost = max(jump_boost, 0.85)
-    if jump_warn:
-        jump_boost = max(jump_boost, 0.5)
 
     # Layer B2: rolling baseline z-scores
-    zs = _z_scores(reading, history, features)
-    z_max = max(abs(z) for z in zs.values()) if zs else 0.0
-    baseline_prob = _sigmoid((z_max - 2.0) * 1.4)
+    hist_matrix = context.get("history_matrix")
+    if hist_matrix is None:
+        hist_matrix = _history_matrix(history, features)
+    z_vec = _z_vector(reading, features, hist_matrix)
+    zs = dict(zip(features, z_vec.tolist()))
+    baseline_scale = 1.0
     storm_mode = context.get("storm_mode") if context else False
     if storm_mode and node_type == "water":
         turb_z = abs(zs.get("turbidity", 0))
         if turb_z > 0 and all(k in ["turbidity"] for k in zs.keys()):
-            baseline_prob *= 0.8
+            baseline_scale = 0.8
+
+    baseline_prob = _baseline_probability(z_vec, baseline_scale)
 
-    # Optional IsolationForest
+    # Optional IsolationForest; skipped when baseline/jump already force Danger
     iso_prob = 0.0
     iso_used = False
-    model_path = GROUND_MODEL_PATH if node_type == "ground" else WATER_MODEL_PATH
-    if model_path.exists():
+    if context.get("iso_prob") is not None:
+        # Precomputed by score_nodes() for a batch of nodes
+        iso_prob = float(context["iso_prob"])
+        iso_used = True
+    elif not jump_danger and baseline_prob < DANGER_PROB:
+        model_path = GROUND_MODEL_PATH if node_type == "ground" else WATER_MODEL_PATH
         try:
-            model = joblib.load(model_path)
+            model = _load_model(model_path)
+        except Exception:
+            model = None
+        if model is not None:
             iso_prob = _iso_probability(model, features, reading)
             iso_used = True
-        except Exception:
-            iso_prob = 0.0
-
-    abnormal_probability = max(baseline_prob, iso_prob, jump_boost)
-
-    # Multi-sensor bump
-    abnormal_count = sum(1 for z in zs.values() if abs(z) >= 2.5) + len(warn_features)
-    warn_hit = warn_hard or jump_warn
-    danger_hit = jump_danger
-    if abnormal_count >= 3:
-        abnormal_probability = min(1.0, abnormal_probability + 0.25)
-    elif abnormal_count >= 2:
-        abnormal_probability = min(1.0, abnormal_probability + 0.15)
-    if warn_hard:
-        warn_hit = True
 
-    # Enforce probability floors when clear warning/danger cues exist
-    if danger_hit:
-        abnormal_probability = max(abnormal_probability, 0.8)
-    if warn_hit:
-        abnormal_probability = max(abnormal_probability, 0.5)
-    if danger_hard:
-        abnormal_probability = max(abnormal_probability, 0.99)
-        danger_hit = True
-
-    # Low-history fail-safe: enforce warning/danger if thresholds hit
-    if history_len < 30:
-        if warn_hard:
-            abnormal_probability = max(abnormal_probability, 0.5)
-            warn_hit = True
-        if danger_hit:
-            abnormal_probability = max(abnormal_probability, 0.8)
+    abnormal_probability, warn_hit, danger_hit, abnormal_count = _score_core(
+        z_vec,
+        len(warn_features),
+        warn_hard,
+        danger_hard,
+        jump_warn,
+        jump_danger,
+        float(iso_prob),
+        baseline_prob,
+        history_len,
+    )
 
     # Status decision
     status = _status_from_prob(abnormal_probability, warn_forced=warn_hit, danger_forced=danger_hit)
@@ -253,15 +484,14 @@ def predict_node(reading, history, node_id, context=None):
 
     # Flagged features (top 3 by |z|)
     flagged = jump_flagged.copy()
-    for feat, z in sorted(zs.items(), key=lambda item: abs(item[1]), reverse=True):
+    top_k = max(1, 3 - len(flagged))
+    for feat, z in heapq.nlargest(top_k, zs.items(), key=lambda item: abs(item[1])):
         flagged.append({
             "feature": feat,
             "z": z,
             "direction": "high" if z >= 0 else "low",
             "value": reading.get(feat),
         })
-        if len(flagged) >= 3:
-            break
 
     reasons = []
     # Hard warning reasons already gathered
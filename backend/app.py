@@ -1,31 +1,76 @@
 ﻿from flask import Flask, request, jsonify, send_from_directory # type: ignore
 from flask_cors import CORS  # type: ignore
 from flask import render_template  # type: ignore
+from flask.json.provider import DefaultJSONProvider  # type: ignore
+import orjson
 from pathlib import Path
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import logging
 import os
+import re
+import threading
 import time
-from db import init_db, insert_reading, get_recent, get_history, prune_old, insert_event, get_events, get_latest
+from db import add_commit_listener, init_db, insert_reading, get_recent, get_history, insert_event, get_events, get_latest
 from config import load_config
-from security import NonceCache, verify_signature
+from security import NonceCache, prime_hmac_templates, verify_signature
 from status_engine import StatusEngine
 from ingest_utils import normalize_reading
+from telemetry_log import TelemetryLogWriter
 
 BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = BASE_DIR.parent / "frontend"
 STATIC_DIR = FRONTEND_DIR / "static"
 
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Route request.get_json/jsonify through orjson (numpy scalars serialize natively)."""
+
+    # Compact, insertion-ordered output; also applies if a base-class path is hit
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+# Local dev frontends on any port; compiled once at import
+CORS_ORIGINS = [
+    re.compile(r"http://127\.0\.0\.1:\d+$", re.IGNORECASE),
+    re.compile(r"http://localhost:\d+$", re.IGNORECASE),
+    "http://127.0.0.1",
+    "http://localhost",
+]
+
 app = Flask(__name__, static_folder=str(STATIC_DIR), static_url_path="/static")
-CORS(app, resources={r"/api/*": {"origins": [r"http://127\\.0\\.0\\.1:\\d+", r"http://localhost:\\d+","http://127.0.0.1","http://localhost"]}})
+app.json = OrjsonProvider(app)
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
 init_db()
 APP_CONFIG = load_config()
 NONCE_CACHE = NonceCache(APP_CONFIG.security.nonce_ttl_sec)
+prime_hmac_templates(APP_CONFIG.security.hmac_secrets)
 STATUS_ENGINE = StatusEngine(APP_CONFIG)
 
 GROUND_FIELDS = ["radiation_cpm", "pm25", "air_temp_c", "humidity", "pressure_hpa", "voc"]
 WATER_FIELDS = ["tds", "ph", "turbidity", "water_temp_c"]
-ALL_FIELDS = set(GROUND_FIELDS + WATER_FIELDS)
+# Ordered and de-duplicated once; handed to normalize_reading on every ingest
+ALL_FIELDS = tuple(dict.fromkeys(GROUND_FIELDS + WATER_FIELDS))
+# Fields a node may send beyond its own required set
+OPTIONAL_FIELDS = {
+    "ground": tuple(f for f in WATER_FIELDS if f not in GROUND_FIELDS),
+    "water": tuple(f for f in GROUND_FIELDS if f not in WATER_FIELDS),
+}
 NODE_IDS = ["ground_1", "ground_2", "ground_3", "water_1"]
 OFFLINE_SECONDS = 120
 last_ingest_snapshot = {
@@ -35,6 +80,14 @@ last_ingest_snapshot = {
     "server_received_utc": None,
 }
 TELEMETRY_LOG_PATH = BASE_DIR / "telemetry_log.jsonl"
+TELEMETRY_LOG = TelemetryLogWriter(TELEMETRY_LOG_PATH)
+# /api/status is polled by every dashboard; serve the serialized payload for a short TTL
+STATUS_CACHE_TTL_SEC = 1.0
+_status_cache = {"body": None, "expires": 0.0, "gen": 0}
+_status_lock = threading.Lock()
+# Ingest acknowledges the stored reading right away; the node's recompute runs here
+# and lands in STATUS_ENGINE.cache for the next /api/status poll
+RECOMPUTE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recompute")
 
 @app.get("/api/health")
 def health():
@@ -47,55 +100,60 @@ def time_endpoint():
 @app.post("/api/ingest")
 def ingest():
     # TODO: add auth/rate limiting for ingest when moving beyond demo
-    raw_body = request.get_data(as_text=True)
+    body_bytes = request.get_data(cache=True)
     server_received_utc = datetime.utcnow().isoformat() + "Z"
     try:
-        data = request.get_json(force=True)
-    except Exception:
+        data = orjson.loads(body_bytes)
+    except orjson.JSONDecodeError:
+        return jsonify({"error": "Invalid JSON body"}), 400
+    if not isinstance(data, dict):
         return jsonify({"error": "Invalid JSON body"}), 400
 
     node_id = data.get("node_id")
     if node_id not in NODE_IDS:
         return jsonify({"error": "node_id must be one of ground_1, ground_2, ground_3, water_1"}), 400
 
-    required = GROUND_FIELDS if node_id.startswith("ground") else WATER_FIELDS
+    node_type = "ground" if node_id.startswith("ground") else "water"
+    required = GROUND_FIELDS if node_type == "ground" else WATER_FIELDS
     missing = [k for k in required if data.get(k) is None]
     if missing:
         return jsonify({"error": f"Missing fields for {node_id}: {', '.join(missing)}"}), 400
 
     ts_in = data.get("ts") or datetime.utcnow().isoformat() + "Z"
     reading = {"ts": ts_in, "node_id": node_id}
+    # Required fields were checked above, so only the other node type's fields can default
+    defaulted = []
     try:
-        for field in ALL_FIELDS:
-            if data.get(field) is None:
+        reading.update({field: float(data[field]) for field in required})
+        for field in OPTIONAL_FIELDS[node_type]:
+            val = data.get(field)
+            if val is None:
                 reading[field] = None
+                defaulted.append(field)
             else:
-                reading[field] = float(data[field])
+                reading[field] = float(val)
     except (TypeError, ValueError):
         return jsonify({"error": "Numeric fields must be numbers"}), 400
-    reading, flags = normalize_reading(node_id, reading, ts_in, list(ALL_FIELDS), APP_CONFIG)
+    reading, flags = normalize_reading(node_id, reading, ts_in, ALL_FIELDS, APP_CONFIG)
 
-    defaulted = [f for f in ALL_FIELDS if data.get(f) is None]
     if defaulted:
-        app.logger.info(f"INGEST DEFAULTED fields to None: {', '.join(defaulted)}")
+        app.logger.info("INGEST DEFAULTED fields to None: %s", ", ".join(defaulted))
 
     inserted_id = insert_reading(reading)
-    prune_old()
     normalized = {"id": inserted_id, **reading}
-    app.logger.info(f"INGEST RECEIVED: {raw_body}")
-    app.logger.info(f"INGEST STORED: {normalized}")
+    if app.logger.isEnabledFor(logging.INFO):
+        app.logger.info("INGEST RECEIVED: %s", body_bytes.decode("utf-8", "replace"))
+        app.logger.info("INGEST STORED: %s", normalized)
+    # Raw bytes; decoded only when the debug endpoint asks for them
     last_ingest_snapshot.update({
-        "received": raw_body,
+        "received": body_bytes,
         "stored": normalized,
         "inserted_id": inserted_id,
         "server_received_utc": server_received_utc,
     })
 
-    history = get_history(node_id, n=200)
-    latest = history[-1] if history else reading
-    node_flags = {node_id: flags}
-    node_features = {node_id: (GROUND_FIELDS if node_id.startswith("ground") else WATER_FIELDS)}
-    STATUS_ENGINE.recompute({node_id: history}, node_features, node_flags)
+    RECOMPUTE_EXECUTOR.submit(_recompute_node, node_id, flags)
+    # Last computed status; the recompute for this reading may still be running
     result = STATUS_ENGINE.cache.node_status.get(node_id)
     payload = {
         "node_id": node_id,
@@ -103,13 +161,24 @@ def ingest():
         "confidence": result.confidence if result else 0.0,
         "reasons": result.reasons if result else [],
         "human_summary": result.summary if result else "",
-        "latest": latest,
+        "latest": normalized,
         "flags": flags,
         "computed_at": result.computed_at if result else datetime.utcnow().isoformat() + "Z",
         "inserted_id": inserted_id,
     }
     return jsonify(payload)
 
+def _recompute_node(node_id, flags):
+    try:
+        history = get_history(node_id, n=200)
+        node_features = {node_id: (GROUND_FIELDS if node_id.startswith("ground") else WATER_FIELDS)}
+        # Merge, so the other nodes keep their last status for ingest responses and polls
+        STATUS_ENGINE.recompute({node_id: history}, node_features, {node_id: flags}, merge=True)
+    except Exception:
+        app.logger.exception("Status recompute failed for %s", node_id)
+    # After the recompute, so a poll racing it can't cache the pre-recompute status
+    _invalidate_status_cache()
+
 @app.post("/api/telemetry")
 def telemetry():
     expected_key = os.getenv("ESP32_API_KEY")
@@ -152,8 +221,6 @@ def telemetry():
 
     fields = GROUND_FIELDS if node_id.startswith("ground") else WATER_FIELDS
     reading, flags = normalize_reading(node_id, data, ts_iso, fields, APP_CONFIG)
-    insert_reading(reading)
-    prune_old()
 
     record = {
         "device_id": node_id,
@@ -161,8 +228,17 @@ def telemetry():
         "data": data,
         "server_received_utc": datetime.utcnow().isoformat() + "Z",
     }
-    with open(TELEMETRY_LOG_PATH, "a", encoding="utf-8") as handle:
-        handle.write(json.dumps(record) + "\n")
+    try:
+        queued = TELEMETRY_LOG.write(record)
+    except orjson.JSONEncodeError:
+        return jsonify({"error": "Telemetry data can't be serialized"}), 400
+    if not queued:
+        # Log writer is backed up; ask the device to retry rather than queue unboundedly
+        resp = jsonify({"error": "Telemetry backlog full, retry later"})
+        resp.headers["Retry-After"] = "1"
+        return resp, 503
+    # The writer invalidates the status cache once the row is committed
+    insert_reading(reading, wait=False)
 
     return jsonify({"ok": True, "node_id": node_id, "ts": ts_iso, "flags": flags})
 
@@ -182,8 +258,15 @@ def recent():
         return jsonify({"rows": rows, "baseline": baseline or {}})
     return jsonify({"rows": get_recent(n, node_id=node_id)})
 
-@app.get("/api/status")
-def status():
+@lru_cache(maxsize=1024)
+def _ts_epoch(ts):
+    """Epoch seconds for an ISO timestamp (naive means UTC); latest rows repeat across polls."""
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _build_status():
     nodes = {}
     latest_ts = None
     any_data = False
@@ -210,9 +293,9 @@ def status():
 
         latest = history[-1]
         any_data = True
+        # compute_node drops pm25 itself for nodes carrying the pm25 flag
         node_features[node_id] = GROUND_FIELDS if node_id.startswith("ground") else WATER_FIELDS
         if node_id in APP_CONFIG.behavior.disable_pm25_nodes:
-            node_features[node_id] = [f for f in node_features[node_id] if f != "pm25"]
             node_flags[node_id] = {APP_CONFIG.behavior.pm25_flag_name: True}
         else:
             node_flags[node_id] = {}
@@ -223,29 +306,30 @@ def status():
         nodes[node_id]["latest"] = latest
 
     if not any_data:
-        return jsonify({
+        return {
             "ok": True,
             "status": "NO_DATA_YET",
             "latest": None,
             "nodes": nodes,
             "last_updated_ts": None,
-        })
+        }
 
     if now - STATUS_ENGINE.cache.computed_at_epoch >= APP_CONFIG.status.recompute_interval_sec:
         STATUS_ENGINE.recompute(node_histories, node_features, node_flags)
 
     status_cache = STATUS_ENGINE.cache
+    # A copy: the engine's cached dict is shared with concurrent recomputes
+    node_statuses = dict(status_cache.node_status)
     for node_id, history in node_histories.items():
-        if node_id not in status_cache.node_status and history:
-            node_result = STATUS_ENGINE.compute_node(
+        if node_id not in node_statuses and history:
+            node_statuses[node_id] = STATUS_ENGINE.compute_node(
                 node_id,
                 history[-1],
                 history,
                 node_features.get(node_id, []),
                 node_flags.get(node_id, {}),
             )
-            status_cache.node_status[node_id] = node_result
-    for node_id, node_result in status_cache.node_status.items():
+    for node_id, node_result in node_statuses.items():
         nodes[node_id] = {
             "node_id": node_id,
             "status": node_result.status,
@@ -260,19 +344,19 @@ def status():
         }
 
     # Offline detection (no recent data)
+    now_epoch = time.time()
     for node_id, data in nodes.items():
         latest = (data or {}).get("latest") or {}
         ts = latest.get("ts")
         if not ts:
             continue
         try:
-            ts_clean = ts.replace("Z", "+00:00")
-            dt = datetime.fromisoformat(ts_clean)
-            if (datetime.utcnow() - dt.replace(tzinfo=None)).total_seconds() > OFFLINE_SECONDS:
-                data["status"] = "Offline"
-                data["reasons"] = (data.get("reasons") or []) + [f"No data received from {node_id} in last {OFFLINE_SECONDS//60} minutes"]
-        except Exception:
+            ts_epoch = _ts_epoch(ts)
+        except (TypeError, ValueError, AttributeError):
             continue
+        if now_epoch - ts_epoch > OFFLINE_SECONDS:
+            data["status"] = "Offline"
+            data["reasons"] = (data.get("reasons") or []) + [f"No data received from {node_id} in last {OFFLINE_SECONDS//60} minutes"]
 
     any_online = any((data or {}).get("status") != "Offline" for data in nodes.values())
     overall_status = status_cache.overall.get("status", "Safe")
@@ -290,7 +374,7 @@ def status():
             reason = "; ".join((data.get("reasons") or [])[:2])
             insert_event(status if status != "ABNORMAL" else "Warning", node_id, "anomaly", reason, data.get("confidence", 0.0))
 
-    return jsonify({
+    return {
         "overall_status": overall_status,
         "overall_abnormal_probability": status_cache.overall.get("confidence", 0.0),
         "overall_reasons": overall_reasons,
@@ -299,7 +383,30 @@ def status():
         "context": {"storm_mode": False},
         "last_updated_ts": latest_ts,
         "computed_at": status_cache.overall.get("computed_at"),
-    })
+    }
+
+@app.get("/api/status")
+def status():
+    now = time.monotonic()
+    if now < _status_cache["expires"]:
+        return app.response_class(_status_cache["body"], mimetype="application/json")
+    with _status_lock:
+        # Concurrent pollers wait here and reuse the payload built by the first one
+        if time.monotonic() < _status_cache["expires"]:
+            return app.response_class(_status_cache["body"], mimetype="application/json")
+        gen = _status_cache["gen"]
+        body = orjson.dumps(_build_status(), option=ORJSON_OPTIONS)
+        if gen == _status_cache["gen"]:
+            _status_cache["body"] = body
+            _status_cache["expires"] = time.monotonic() + STATUS_CACHE_TTL_SEC
+    return app.response_class(body, mimetype="application/json")
+
+def _invalidate_status_cache():
+    _status_cache["gen"] += 1
+    _status_cache["expires"] = 0.0
+
+# After the commit, so a poll can't cache a payload built before the row was visible
+add_commit_listener(_invalidate_status_cache)
 
 @app.get("/api/events")
 def events():
@@ -328,7 +435,10 @@ def latest_one(node_id):
 
 @app.get("/api/debug/last_ingest")
 def debug_last_ingest():
-    return jsonify(last_ingest_snapshot)
+    snapshot = dict(last_ingest_snapshot)
+    if snapshot["received"] is not None:
+        snapshot["received"] = snapshot["received"].decode("utf-8", "replace")
+    return jsonify(snapshot)
 
 @app.get("/")
 def index():
@@ -1,7 +1,19 @@
+import atexit
+import logging
+import os
+import queue
 import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
 DB_PATH = Path(__file__).parent / "readings.db"
 MAX_ROWS = 5000
 
@@ -21,11 +33,84 @@ COL_TYPES = {
     "water_temp_c": "REAL",
 }
 COLS = list(COL_TYPES.keys())
+# Tuples built once and shared by every dict(zip(...)) row conversion
+ROW_KEYS = ("id", *COLS)
+ROW_INDEX = {key: i for i, key in enumerate(ROW_KEYS)}
+
+INSERT_SQL = f"INSERT INTO readings ({', '.join(COLS)}) VALUES ({', '.join(['?'] * len(COLS))})"
+SELECT_SQL = f"SELECT {', '.join(ROW_KEYS)} FROM readings"
+# get_recent queries keyed by whether they filter on node_id
+RECENT_SQL = {
+    False: SELECT_SQL + " ORDER BY id DESC LIMIT ?",
+    True: SELECT_SQL + " WHERE node_id = ? ORDER BY id DESC LIMIT ?",
+}
+STORED_SQL = SELECT_SQL + " WHERE id BETWEEN ? AND ?"
+
+# Inserts go through one writer thread that commits whatever has queued up as a
+# single transaction (group commit), pruning once PRUNE_EVERY_ROWS rows have been
+# written since the last prune.
+WRITE_QUEUE_MAX = 10000
+WRITE_BATCH_MAX = 256
+PRUNE_EVERY_ROWS = 64
+# Longest insert_reading(wait=True) blocks for its batch to commit
+WRITE_WAIT_TIMEOUT = 30.0
+_write_queue = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+_writer = {"thread": None, "pid": None}
+_writer_lock = threading.Lock()
+# Called by the writer (no arguments) after each commit that wrote rows
+_commit_listeners = []
+
+# Newest HISTORY_LEN rows per node kept in memory: warmed from the DB on first
+# use, appended by the writer after each commit and trimmed when rows are pruned
+HISTORY_LEN = 200
+_history = {}
+_history_state = {"key": None}
+_history_lock = threading.Lock()
 
-EVENT_COLS = ["id", "ts", "level", "node_id", "event_type", "message", "abnormal_probability"]
+# DB files whose schema has already been checked by this process
+_schema_checked = set()
+
+# One connection per thread (and per process, since connections can't cross fork)
+_local = threading.local()
+
+EVENT_COLS = ("id", "ts", "level", "node_id", "event_type", "message", "abnormal_probability")
+
+def get_conn():
+    """Return this thread's SQLite connection, opening and tuning it on first use."""
+    con = getattr(_local, "con", None)
+    if con is None or _local.pid != os.getpid() or _local.path != DB_PATH:
+        con = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA mmap_size=134217728")
+        con.execute("PRAGMA cache_size=-20000")
+        con.execute("PRAGMA temp_store=MEMORY")
+        _local.con = con
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+    return con
+
+@contextmanager
+def transaction():
+    """Run several statements on this thread's connection as one write transaction.
+
+    Connections are in autocommit mode, so single statements need no wrapper;
+    BEGIN IMMEDIATE takes the write lock up front and commits with one fsync.
+    """
+    con = get_conn()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+        con.execute("COMMIT")
+    except BaseException:
+        # Also after a failed COMMIT, so the next BEGIN doesn't hit an open transaction
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
 
 def init_db():
-    with sqlite3.connect(DB_PATH) as con:
+    with get_conn() as con:
+        # WAL lets dashboard reads proceed while ingest writes; the mode persists in the file
+        con.execute("PRAGMA journal_mode=WAL")
         con.execute("""
         CREATE TABLE IF NOT EXISTS readings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,7 +128,9 @@ def init_db():
             water_temp_c REAL
         )
         """)
-        _ensure_columns(con)
+        if DB_PATH not in _schema_checked:
+            _ensure_columns(con)
+            _schema_checked.add(DB_PATH)
         con.execute("CREATE INDEX IF NOT EXISTS idx_readings_id ON readings(id)")
         con.execute("CREATE INDEX IF NOT EXISTS idx_readings_node_id ON readings(node_id, id)")
         con.execute("CREATE INDEX IF NOT EXISTS idx_readings_node_ts ON readings(node_id, ts)")
@@ -59,6 +146,8 @@ def init_db():
         )
         """)
         con.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)")
+    with _history_lock:
+        _history_ready()
 
 def _ensure_columns(con):
     """Add missing columns if the DB already existed with an older schema."""
@@ -68,7 +157,23 @@ def _ensure_columns(con):
         if col not in existing:
             con.execute(f"ALTER TABLE readings ADD COLUMN {col} {COL_TYPES[col]}")
 
-def insert_reading(r):
+class _PendingInsert:
+    __slots__ = ("values", "done", "rowid", "row", "error")
+
+    def __init__(self, values):
+        self.values = values
+        self.done = threading.Event()
+        self.rowid = None
+        # The row as stored, after SQLite's column affinity (e.g. an int ts becomes TEXT)
+        self.row = None
+        self.error = None
+
+def insert_reading(r, wait=True):
+    """Queue a reading for the writer thread.
+
+    With wait=True (default) block until its batch commits and return the row id;
+    with wait=False return None immediately.
+    """
     ts = r.get("ts") or datetime.utcnow().isoformat() + "Z"
     values = []
     for col in COLS:
@@ -76,70 +181,220 @@ def insert_reading(r):
             values.append(ts)
         else:
             values.append(r.get(col))
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.execute(f"""
-        INSERT INTO readings ({', '.join(COLS)})
-        VALUES ({', '.join(['?'] * len(COLS))})
-        """, tuple(values))
-        return cur.lastrowid
+    item = _PendingInsert(tuple(values))
+    _ensure_writer()
+    _write_queue.put(item)
+    if not wait:
+        return None
+    if not item.done.wait(WRITE_WAIT_TIMEOUT):
+        raise TimeoutError(f"Reading not written within {WRITE_WAIT_TIMEOUT}s")
+    if item.error is not None:
+        raise item.error
+    return item.rowid
 
-def get_recent(n=200, node_id=None, include_baseline=False, features=None):
-    query = f"""
-    SELECT {', '.join(['id'] + COLS)}
-    FROM readings
+def _ensure_writer():
+    pid = os.getpid()
+    thread = _writer["thread"]
+    if thread is not None and thread.is_alive() and _writer["pid"] == pid:
+        return
+    with _writer_lock:
+        thread = _writer["thread"]
+        if thread is not None and thread.is_alive() and _writer["pid"] == pid:
+            return
+        thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+        _writer.update(thread=thread, pid=pid)
+        thread.start()
+
+def add_commit_listener(fn):
+    """Call fn() from the writer thread after every commit that wrote readings.
+
+    For wait=False callers that need to react once their row is visible.
     """
-    params = []
-    if node_id:
-        query += " WHERE node_id = ?"
-        params.append(node_id)
-    query += " ORDER BY id DESC LIMIT ?"
-    params.append(n)
-
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.execute(query, tuple(params))
+    _commit_listeners.append(fn)
+
+def flush_writes(timeout=5.0):
+    """Wait until every reading queued so far has been committed."""
+    thread = _writer["thread"]
+    if thread is None or not thread.is_alive() or _writer["pid"] != os.getpid():
+        return
+    marker = _PendingInsert(None)
+    _write_queue.put(marker)
+    marker.done.wait(timeout)
+
+atexit.register(flush_writes)
+
+def _writer_loop():
+    # Rows written since the last prune; a counter, so deciding needs no COUNT(*)
+    unpruned = 0
+    while True:
+        items = [_write_queue.get()]
+        while len(items) < WRITE_BATCH_MAX:
+            try:
+                items.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        rows = [item for item in items if item.values is not None]
+        if not rows:
+            # Only flush_writes markers: nothing to commit
+            for item in items:
+                item.done.set()
+            continue
+        try:
+            prune = unpruned + len(rows) >= PRUNE_EVERY_ROWS
+            with transaction() as con:
+                # executemany can't report row ids; per-row execute inside one
+                # transaction still shares the single commit
+                for item in rows:
+                    item.rowid = con.execute(INSERT_SQL, item.values).lastrowid
+                _read_back(con, rows)
+                if prune:
+                    _prune(con)
+            unpruned = 0 if prune else unpruned + len(rows)
+            written = rows
+        except Exception:
+            # Any error (a value sqlite3 can't bind raises OverflowError/InterfaceError,
+            # not sqlite3.Error) must not kill this thread or fail the whole batch
+            logger.exception("Failed to write %d readings as one batch; retrying one by one", len(rows))
+            written = _write_each(rows)
+            unpruned += len(written)
+        try:
+            _append_history(written)
+            if written:
+                for listener in _commit_listeners:
+                    listener()
+        except Exception:
+            logger.exception("Failed to update in-memory history or notify commit listeners")
+        finally:
+            for item in items:
+                item.done.set()
+
+def _read_back(con, rows):
+    """Set item.row for just-inserted rows from what SQLite stored (one range query)."""
+    if not rows:
+        return
+    stored = {row[0]: row for row in con.execute(STORED_SQL, (rows[0].rowid, rows[-1].rowid))}
+    for item in rows:
+        item.row = dict(zip(ROW_KEYS, stored[item.rowid]))
+
+def _write_each(rows):
+    """Insert rows in separate transactions; return the ones that were written."""
+    written = []
+    for item in rows:
+        item.rowid = None
+        try:
+            with transaction() as con:
+                item.rowid = con.execute(INSERT_SQL, item.values).lastrowid
+                _read_back(con, [item])
+        except Exception as exc:
+            logger.warning("Failed to write reading %r: %s", item.values, exc)
+            item.rowid = None
+            item.error = exc
+        else:
+            written.append(item)
+    return written
+
+def get_recent(n=200, node_id=None, include_baseline=False, features=None):
+    params = (node_id, n) if node_id else (n,)
+    with get_conn() as con:
+        cur = con.execute(RECENT_SQL[bool(node_id)], params)
     rows = cur.fetchall()
 
-    rows = list(reversed(rows))
-    keys = ["id"] + COLS
-    data = [dict(zip(keys, row)) for row in rows]
+    rows.reverse()
+    data = [dict(zip(ROW_KEYS, row)) for row in rows]
     baseline = None
     if include_baseline and data:
-        feats = features or []
-        baseline = {}
-        for feat in feats:
-            vals = [r.get(feat) for r in data if r.get(feat) is not None]
-            if vals:
-                baseline[feat] = float(sum(vals) / len(vals))
+        feats = [f for f in (features or []) if f in COL_TYPES]
+        # Columnar pass: one (rows, feats) matrix with NaN for NULLs, reduced per column
+        idx = [ROW_INDEX[f] for f in feats]
+        mat = np.array([[row[i] for i in idx] for row in rows], dtype=np.float64).reshape(len(rows), len(feats))
+        present = ~np.isnan(mat)
+        counts = present.sum(axis=0)
+        sums = np.where(present, mat, 0.0).sum(axis=0)
+        baseline = {
+            feat: total / count
+            for feat, total, count in zip(feats, sums.tolist(), counts.tolist())
+            if count
+        }
     return data if not include_baseline else (data, baseline)
 
+def _history_ready():
+    """Return the per-node history buffers, loading them from the DB if needed.
+
+    Must be called with _history_lock held.
+    """
+    key = (os.getpid(), DB_PATH)
+    if _history_state["key"] != key:
+        _history.clear()
+        con = get_conn()
+        node_ids = [row[0] for row in con.execute("SELECT DISTINCT node_id FROM readings")]
+        for node_id in node_ids:
+            _history[node_id] = deque(get_recent(n=HISTORY_LEN, node_id=node_id), maxlen=HISTORY_LEN)
+        _history_state["key"] = key
+    return _history
+
+def _append_history(items):
+    with _history_lock:
+        if _history_state["key"] != (os.getpid(), DB_PATH):
+            # Not warmed yet; the first reader will load these rows from the DB
+            return
+        for item in items:
+            if item.row is None:
+                continue
+            row = item.row
+            buf = _history.get(row["node_id"])
+            if buf is None:
+                buf = _history[row["node_id"]] = deque(maxlen=HISTORY_LEN)
+            # A warm-up that raced this commit may already hold the row
+            if not buf or buf[-1]["id"] < item.rowid:
+                buf.append(row)
+
 def get_history(node_id, n=200):
-    return get_recent(n=n, node_id=node_id)
+    if n > HISTORY_LEN:
+        return get_recent(n=n, node_id=node_id)
+    with _history_lock:
+        buf = _history_ready().get(node_id)
+        if not buf:
+            return []
+        return list(islice(reversed(buf), n))[::-1]
 
-def get_latest(node_id):
-    with sqlite3.connect(DB_PATH) as con:
+def get_history_matrix(node_id, features, n=200):
+    """Oldest-first (rows, len(features)) float32 matrix for node_id, NaN for NULLs.
+
+    Returns (matrix, ts) where ts is the matching array of timestamp strings; this
+    skips building a dict per row for callers that only need the numbers.
+    """
+    unknown = [f for f in features if f not in COL_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown feature columns: {', '.join(unknown)}")
+    with get_conn() as con:
         cur = con.execute(f"""
-        SELECT id, {', '.join(COLS)}
+        SELECT ts, {', '.join(features)}
         FROM readings
         WHERE node_id = ?
         ORDER BY id DESC
-        LIMIT 1
-        """, (node_id,))
-        row = cur.fetchone()
-    if not row:
-        return None
-    keys = ["id"] + COLS
-    return dict(zip(keys, row))
+        LIMIT ?
+        """, (node_id, n))
+        rows = cur.fetchall()
+    rows.reverse()
+    mat = np.array([row[1:] for row in rows], dtype=np.float32).reshape(len(rows), len(features))
+    ts = np.array([row[0] for row in rows], dtype=object)
+    return mat, ts
+
+def get_latest(node_id):
+    with _history_lock:
+        buf = _history_ready().get(node_id)
+        return buf[-1] if buf else None
 
 def insert_event(level, node_id, event_type, message, abnormal_probability):
     ts = datetime.utcnow().isoformat()
-    with sqlite3.connect(DB_PATH) as con:
+    with get_conn() as con:
         con.execute("""
         INSERT INTO events (ts, level, node_id, event_type, message, abnormal_probability)
         VALUES (?, ?, ?, ?, ?, ?)
         """, (ts, level, node_id, event_type, message, abnormal_probability))
 
 def get_events(n=50):
-    with sqlite3.connect(DB_PATH) as con:
+    with get_conn() as con:
         cur = con.execute("""
         SELECT id, ts, level, node_id, event_type, message, abnormal_probability
         FROM events ORDER BY id DESC LIMIT ?
@@ -148,13 +403,17 @@ def get_events(n=50):
     return [dict(zip(EVENT_COLS, row)) for row in rows]
 
 def prune_old():
-    with sqlite3.connect(DB_PATH) as con:
-        cur = con.execute("SELECT COUNT(*) FROM readings")
-        count = cur.fetchone()[0]
-        if count > MAX_ROWS:
-            to_delete = count - MAX_ROWS
-            con.execute("""
-            DELETE FROM readings WHERE id IN (
-                SELECT id FROM readings ORDER BY id ASC LIMIT ?
-            )
-            """, (to_delete,))
+    with transaction() as con:
+        _prune(con)
+
+def _prune(con):
+    # Row ids only grow, so this keeps the newest MAX_ROWS ids without a COUNT(*) scan
+    max_id = con.execute("SELECT MAX(id) FROM readings").fetchone()[0]
+    if max_id is None:
+        return
+    cutoff = max_id - MAX_ROWS
+    con.execute("DELETE FROM readings WHERE id <= ?", (cutoff,))
+    with _history_lock:
+        for buf in _history.values():
+            while buf and buf[0]["id"] <= cutoff:
+                buf.popleft()
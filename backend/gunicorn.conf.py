@@ -0,0 +1,15 @@
+# gunicorn settings; the Procfile and DEPLOY_RENDER.md start the app with -c gunicorn.conf.py
+import os
+
+wsgi_app = "wsgi:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Threads serve dashboard polls concurrently with ingest (SQLite runs in WAL mode).
+# One worker by default: the nonce replay cache, status cache and history buffers
+# are per-process, so extra workers would each see only part of the traffic.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import the app (and run init_db) once in the master before forking workers
+preload_app = True
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+from typing import Dict, Sequence, Tuple
 from datetime import datetime
 
 from config import AppConfig
@@ -10,7 +10,7 @@ def normalize_reading(
     node_id: str,
     payload: Dict,
     ts_iso: str,
-    fields: List[str],
+    fields: Sequence[str],
     config: AppConfig,
 ) -> Tuple[Dict, Dict[str, bool]]:
     reading: Dict = {"node_id": node_id, "ts": ts_iso}
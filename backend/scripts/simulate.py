@@ -1,10 +1,12 @@
+import http.client
 import json
 import random
 import time
 from datetime import datetime
-from urllib import request
+from urllib.parse import urlsplit
 
 API_URL = "http://127.0.0.1:5000/api/ingest"
+_API = urlsplit(API_URL)
 
 GROUND_NODES = ["ground_1", "ground_2", "ground_3"]
 WATER_NODE = "water_1"
@@ -12,13 +14,24 @@ OFFLINE_SECONDS = 120
 
 offline_state = {"ground_3": False, "resume_at": None}
 storm_phase = 0
+# One keep-alive connection reused for every send; reopened if the server drops it
+conn = {"http": None}
 
 def send(payload):
     data = json.dumps(payload).encode("utf-8")
-    req = request.Request(API_URL, data=data, headers={"Content-Type": "application/json"})
-    with request.urlopen(req) as resp:
-        body = resp.read().decode("utf-8")
-        return resp.status, body
+    headers = {"Content-Type": "application/json"}
+    for attempt in range(2):
+        if conn["http"] is None:
+            conn["http"] = http.client.HTTPConnection(_API.hostname, _API.port or 80, timeout=5)
+        try:
+            conn["http"].request("POST", _API.path, body=data, headers=headers)
+            resp = conn["http"].getresponse()
+            return resp.status, resp.read().decode("utf-8")
+        except (http.client.HTTPException, OSError):
+            conn["http"].close()
+            conn["http"] = None
+            if attempt:
+                raise
 
 def ground_reading(node_id):
     reading = {
@@ -16,24 +16,69 @@ MIN_ROWS = 200
 CONTAMINATION = 0.05
 N_ESTIMATORS = 200
 RANDOM_STATE = 42
+MAX_ROWS = 5000
 
 
-def fetch_rows(node_ids, features, limit=5000):
+def fetch_rows(node_ids, features, limit=MAX_ROWS, after_id=0):
+    """Newest `limit` complete rows with id > after_id, oldest first.
+
+    Returns (data, last_id) where last_id is the highest id examined, including
+    rows dropped for NULLs, so the next incremental fetch starts after it.
+    """
     placeholders = ",".join(["?"] * len(node_ids))
     query = f"""
-    SELECT {', '.join(features)}
+    SELECT id, {', '.join(features)}
     FROM readings
-    WHERE node_id IN ({placeholders})
+    WHERE node_id IN ({placeholders}) AND id > ?
     ORDER BY id DESC
     LIMIT ?
     """
-    params = [*node_ids, limit]
+    params = [*node_ids, after_id, limit]
     with sqlite3.connect(DB_PATH) as con:
         cur = con.execute(query, params)
         rows = cur.fetchall()
-    # Filter out rows with any NULLs
-    filtered = [row for row in rows if all(val is not None for val in row)]
-    return np.array(filtered, dtype=float)
+    rows.reverse()
+    # NULLs become NaN in the float cast; drop any row containing one
+    arr = np.array(rows, dtype=np.float64).reshape(len(rows), len(features) + 1)
+    last_id = int(arr[-1, 0]) if len(arr) else after_id
+    data = arr[:, 1:]
+    return data[~np.isnan(data).any(axis=1)], last_id
+
+
+def _anchor(con, last_id):
+    """ts and node_id of row last_id, identifying the data the cache was built from."""
+    row = con.execute("SELECT ts, node_id FROM readings WHERE id = ?", (last_id,)).fetchone()
+    return "" if row is None else f"{row[0]}|{row[1]}"
+
+
+def load_features(name, node_ids, features):
+    """Feature matrix for training, reusing ai/<name>_features.npz from the last run.
+
+    Only rows newer than the cached last_id are queried; the result keeps the
+    newest MAX_ROWS rows and is written back to the cache. Readings are append-only,
+    so the cache stays valid while row last_id still holds the same reading; if the
+    database was recreated or pruned past it, the cache is rebuilt from scratch.
+    """
+    cache_path = AI_DIR / f"{name}_features.npz"
+    cached = np.empty((0, len(features)))
+    last_id = 0
+    anchor = ""
+    if cache_path.exists():
+        with np.load(cache_path) as npz:
+            if list(npz["features"]) == list(features) and "anchor" in npz:
+                cached = npz["data"]
+                last_id = int(npz["last_id"])
+                anchor = str(npz["anchor"])
+    with sqlite3.connect(DB_PATH) as con:
+        if last_id and _anchor(con, last_id) != anchor:
+            cached = np.empty((0, len(features)))
+            last_id = 0
+        new, last_id = fetch_rows(node_ids, features, after_id=last_id)
+        anchor = _anchor(con, last_id) if last_id else ""
+    data = np.vstack([cached, new])[-MAX_ROWS:]
+    AI_DIR.mkdir(parents=True, exist_ok=True)
+    np.savez(cache_path, data=data, last_id=last_id, anchor=anchor, features=np.array(features))
+    return data
 
 
 def train_and_save(data, features, path):
@@ -41,10 +86,11 @@ def train_and_save(data, features, path):
         n_estimators=N_ESTIMATORS,
         contamination=CONTAMINATION,
         random_state=RANDOM_STATE,
+        n_jobs=-1,
     )
     model.fit(data)
     AI_DIR.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, path)
+    joblib.dump(model, path, compress=3)
     print(f"Saved model: {path} ({data.shape[0]} rows, {data.shape[1]} features)")
 
 
@@ -53,13 +99,13 @@ def main():
         print(f"Database not found at {DB_PATH}. Run the simulator first.")
         return
 
-    ground_data = fetch_rows(["ground_1", "ground_2", "ground_3"], GROUND_FEATURES)
+    ground_data = load_features("ground", ["ground_1", "ground_2", "ground_3"], GROUND_FEATURES)
     if len(ground_data) < MIN_ROWS:
         print(f"Ground: not enough rows ({len(ground_data)}). Need at least {MIN_ROWS}.")
     else:
         train_and_save(ground_data, GROUND_FEATURES, AI_DIR / "isoforest_ground.pkl")
 
-    water_data = fetch_rows(["water_1"], WATER_FEATURES)
+    water_data = load_features("water", ["water_1"], WATER_FEATURES)
     if len(water_data) < MIN_ROWS:
         print(f"Water: not enough rows ({len(water_data)}). Need at least {MIN_ROWS}.")
     else:
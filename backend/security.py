@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import hmac
 import hashlib
+import threading
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Dict, Tuple
 
@@ -19,24 +21,69 @@ class SignatureResult:
 
 
 class NonceCache:
-    def __init__(self, ttl_sec: int) -> None:
-        self._ttl = ttl_sec
-        self._store: Dict[str, Dict[str, int]] = {}
+    """Nonces seen per node within the TTL, capped at max_per_node entries.
 
-    def seen(self, node_id: str, nonce: str, now: int) -> bool:
-        node_nonces = self._store.setdefault(node_id, {})
-        # purge old
-        expired = [n for n, ts in node_nonces.items() if now - ts > self._ttl]
-        for n in expired:
-            node_nonces.pop(n, None)
-        if nonce in node_nonces:
-            return True
-        node_nonces[nonce] = now
-        return False
+    At the cap the oldest nonce is evicted early; only authenticated requests
+    are recorded, so reaching it takes a node signing that many requests
+    within one TTL.
+    """
 
+    def __init__(self, ttl_sec: int, max_per_node: int = 100_000) -> None:
+        self._ttl = ttl_sec
+        self._cap = max_per_node
+        # Per node, nonces in insertion (= arrival time) order
+        self._store: Dict[str, OrderedDict[str, int]] = {}
+        # Request threads share the cache; check, evict and insert must be one step
+        self._lock = threading.Lock()
 
-def _sign_message(secret: str, message: bytes) -> str:
-    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    def seen(self, node_id: str, nonce: str, now: int) -> bool:
+        with self._lock:
+            node_nonces = self._store.get(node_id)
+            if node_nonces is None:
+                node_nonces = self._store[node_id] = OrderedDict()
+            # purge old: the oldest entries are at the front, so stop at the first live one
+            while node_nonces:
+                _, ts = next(iter(node_nonces.items()))
+                if now - ts <= self._ttl:
+                    break
+                node_nonces.popitem(last=False)
+            if nonce in node_nonces:
+                return True
+            if len(node_nonces) >= self._cap:
+                node_nonces.popitem(last=False)
+            node_nonces[nonce] = now
+            return False
+
+
+_LOWER_HEX = frozenset("0123456789abcdef")
+
+# Keyed HMAC state per secret; copying it skips the key schedule on every request.
+# Keyed by the secret itself so a changed secret never reuses a stale template.
+_HMAC_TEMPLATES: Dict[str, "hmac.HMAC"] = {}
+
+
+def _hmac_template(secret: str) -> "hmac.HMAC":
+    template = _HMAC_TEMPLATES.get(secret)
+    if template is None:
+        template = _HMAC_TEMPLATES[secret] = hmac.new(secret.encode("utf-8"), b"", hashlib.sha256)
+    return template
+
+
+def prime_hmac_templates(secrets: Dict[str, str]) -> None:
+    """Key the HMAC templates for all configured node secrets up front."""
+    for secret in secrets.values():
+        if secret:
+            _hmac_template(secret)
+
+
+def _sign_message(secret: str, *parts: bytes) -> bytes:
+    """Raw HMAC-SHA256 of parts joined with b"." (fed incrementally, never concatenated)."""
+    h = _hmac_template(secret).copy()
+    for i, part in enumerate(parts):
+        if i:
+            h.update(b".")
+        h.update(part)
+    return h.digest()
 
 
 def verify_signature(
@@ -62,23 +109,25 @@ def verify_signature(
     if abs(now - ts) > config.sig_window_sec:
         return SignatureResult(ok=False, error="Timestamp outside allowed window")
 
-    if nonce_cache.seen(node_id, nonce, now):
-        return SignatureResult(ok=False, error="Nonce replay detected")
-
     secret = config.hmac_secrets.get(node_id)
     if not secret:
         return SignatureResult(ok=False, error="Unknown node_id for HMAC")
 
-    message = b".".join(
-        [
-            node_id.encode("utf-8"),
-            str(ts).encode("utf-8"),
-            nonce.encode("utf-8"),
-            body_bytes,
-        ]
+    expected = _sign_message(
+        secret,
+        node_id.encode("utf-8"),
+        str(ts).encode("utf-8"),
+        nonce.encode("utf-8"),
+        body_bytes,
     )
-    expected = _sign_message(secret, message)
-    if not hmac.compare_digest(expected, sig):
+    # fromhex alone would also accept uppercase and whitespace; keep the lowercase hexdigest format
+    if len(sig) != 2 * len(expected) or not _LOWER_HEX.issuperset(sig):
+        return SignatureResult(ok=False, error="Invalid signature")
+    if not hmac.compare_digest(expected, bytes.fromhex(sig)):
         return SignatureResult(ok=False, error="Invalid signature")
 
+    # Only after the signature checks out, so unsigned traffic can't fill the cache
+    if nonce_cache.seen(node_id, nonce, now):
+        return SignatureResult(ok=False, error="Nonce replay detected")
+
     return SignatureResult(ok=True, node_id=node_id, timestamp=ts, nonce=nonce)
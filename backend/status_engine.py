@@ -1,25 +1,32 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
-import math
+import heapq
+import threading
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
+
+from _stats_numba import NUMBA_AVAILABLE, features_nb
 from config import AppConfig
 
 
 NodeId = str
 
+# Rows used for trend slopes
+TREND_WINDOW = 6
+
 
-@dataclass
+@dataclass(slots=True)
 class FeatureVector:
     z_scores: Dict[str, float]
     trend_slopes: Dict[str, float]
     abnormal_count: int
 
 
-@dataclass
+@dataclass(slots=True)
 class Interpretation:
     status: str
     confidence: float
@@ -27,7 +34,7 @@ class Interpretation:
     summary: str
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeStatus:
     node_id: NodeId
     status: str
@@ -39,134 +46,316 @@ class NodeStatus:
     flags: Dict[str, bool]
 
 
-@dataclass
+@dataclass(slots=True)
 class StatusCache:
     node_status: Dict[NodeId, NodeStatus]
     overall: Dict
     computed_at_epoch: int
 
 
-def _median(values: List[float]) -> float:
-    s = sorted(values)
-    n = len(s)
-    mid = n // 2
-    if n % 2 == 1:
-        return s[mid]
-    return (s[mid - 1] + s[mid]) / 2.0
+def _history_matrix(history: List[Dict], features: List[str]) -> np.ndarray:
+    """(len(history), len(features)) float array, NaN where a value is missing."""
+    values = (np.nan if (v := row.get(feat)) is None else v for row in history for feat in features)
+    return np.fromiter(values, dtype=np.float64, count=len(history) * len(features)).reshape(len(history), len(features))
 
 
-def _mad(values: List[float], med: float) -> float:
-    dev = [abs(v - med) for v in values]
-    return _median(dev) if dev else 0.0
+@dataclass(slots=True)
+class NodeHistory:
+    """Columnar (SoA) history for one node: a float64 column per feature plus row ids and ts.
 
+    Live rows are values[start:start + length]; appends grow the buffer
+    geometrically and drop_front just advances `start`, so sliding the window
+    never re-parses rows. NaN marks a missing value and -1 an unknown id.
+    """
 
-def _z_scores(reading: Dict, history: List[Dict], features: List[str]) -> Dict[str, float]:
-    zs: Dict[str, float] = {}
-    for feat in features:
-        vals = [row.get(feat) for row in history if row.get(feat) is not None]
-        if len(vals) < 5 or reading.get(feat) is None:
-            zs[feat] = 0.0
-            continue
-        vals_f = [float(v) for v in vals]
-        med = _median(vals_f)
-        mad = _mad(vals_f, med)
-        scale = mad * 1.4826 if mad > 0 else (math.sqrt(sum((v - med) ** 2 for v in vals_f) / len(vals_f)) or 1e-6)
-        zs[feat] = (float(reading[feat]) - med) / scale
-    return zs
+    node_id: str
+    features: Tuple[str, ...]
+    values: np.ndarray
+    ids: np.ndarray
+    ts: np.ndarray
+    start: int = 0
+    length: int = 0
 
+    @classmethod
+    def empty(cls, node_id: str, features: Sequence[str], capacity: int = 256) -> "NodeHistory":
+        return cls(
+            node_id=node_id,
+            features=tuple(features),
+            values=np.empty((capacity, len(features))),
+            ids=np.empty(capacity, dtype=np.int64),
+            ts=np.empty(capacity, dtype=object),
+        )
 
-def _trend_slopes(history: List[Dict], features: List[str], window: int = 6) -> Dict[str, float]:
-    slopes: Dict[str, float] = {}
-    if len(history) < 2:
-        return {f: 0.0 for f in features}
-    h = history[-window:]
-    xs = list(range(len(h)))
-    x_mean = sum(xs) / len(xs)
-    x_var = sum((x - x_mean) ** 2 for x in xs) or 1e-6
-    for feat in features:
-        ys = [row.get(feat) for row in h if row.get(feat) is not None]
-        if len(ys) < 2:
-            slopes[feat] = 0.0
-            continue
-        ys_f = [float(v) for v in ys]
-        y_mean = sum(ys_f) / len(ys_f)
-        cov = sum((xs[i] - x_mean) * (ys_f[i] - y_mean) for i in range(len(ys_f)))
-        slopes[feat] = cov / x_var
-    return slopes
+    @classmethod
+    def from_rows(cls, node_id: str, rows: List[Dict], features: Sequence[str]) -> "NodeHistory":
+        hist = cls.empty(node_id, features, capacity=max(len(rows), 16))
+        hist.extend(rows)
+        return hist
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(length, n_features) view of the live rows."""
+        return self.values[self.start:self.start + self.length]
+
+    @property
+    def row_ids(self) -> np.ndarray:
+        return self.ids[self.start:self.start + self.length]
+
+    def columns(self, features: Sequence[str]) -> np.ndarray:
+        if tuple(features) == self.features:
+            return self.matrix
+        idx = [self.features.index(f) for f in features]
+        return self.matrix[:, idx]
+
+    def _reserve(self, extra: int) -> None:
+        end = self.start + self.length
+        if end + extra <= len(self.values):
+            return
+        needed = self.length + extra
+        capacity = len(self.values)
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            values = np.empty((capacity, len(self.features)))
+            ids = np.empty(capacity, dtype=np.int64)
+            ts = np.empty(capacity, dtype=object)
+        else:
+            # Enough room once the dropped rows at the front are reclaimed
+            values, ids, ts = self.values, self.ids, self.ts
+        values[:self.length] = self.values[self.start:end]
+        ids[:self.length] = self.ids[self.start:end]
+        ts[:self.length] = self.ts[self.start:end]
+        self.values, self.ids, self.ts, self.start = values, ids, ts, 0
+
+    def extend(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        self._reserve(len(rows))
+        end = self.start + self.length
+        self.values[end:end + len(rows)] = _history_matrix(rows, self.features)
+        self.ids[end:end + len(rows)] = [-1 if row.get("id") is None else row["id"] for row in rows]
+        self.ts[end:end + len(rows)] = [row.get("ts") for row in rows]
+        self.length += len(rows)
+
+    def append(self, reading: Dict) -> None:
+        self.extend([reading])
+
+    def drop_front(self, n: int) -> None:
+        n = min(n, self.length)
+        self.start += n
+        self.length -= n
+
+    def row(self, i: int) -> Dict:
+        i = range(self.length)[i]
+        pos = self.start + i
+        out: Dict = {"node_id": self.node_id, "ts": self.ts[pos]}
+        if self.ids[pos] >= 0:
+            out["id"] = int(self.ids[pos])
+        for feat, v in zip(self.features, self.values[pos].tolist()):
+            out[feat] = None if v != v else v
+        return out
+
+    def to_list_of_dicts(self) -> List[Dict]:
+        return [self.row(i) for i in range(self.length)]
+
+
+def _median(arr: np.ndarray) -> np.ndarray:
+    """Per-column median ignoring NaN; NaN for columns with no values.
+
+    Uses one np.partition (introselect) for every middle rank needed instead of
+    sorting; NaN orders last, so each column's values occupy its first `count` slots.
+    """
+    n_rows, n_cols = arr.shape
+    if n_rows == 0 or n_cols == 0:
+        return np.full(n_cols, np.nan)
+    counts = n_rows - np.isnan(arr).sum(axis=0)
+    lo = np.maximum(counts - 1, 0) // 2
+    hi = np.minimum(counts // 2, n_rows - 1)
+    part = np.partition(arr, np.unique(np.concatenate([lo, hi])), axis=0)
+    cols = np.arange(n_cols)
+    med = (part[lo, cols] + part[hi, cols]) / 2.0
+    return np.where(counts > 0, med, np.nan)
+
+
+def _mad(arr: np.ndarray, med: np.ndarray) -> np.ndarray:
+    return _median(np.abs(arr - med))
+
+
+def _reading_vector(reading: Dict, features: List[str]) -> np.ndarray:
+    return np.array([np.nan if reading.get(f) is None else float(reading[f]) for f in features])
+
+
+def _z_vector(current: np.ndarray, arr: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        med = _median(arr)
+        mad = _mad(arr, med)
+        # Fallback scale: RMS deviation from the median (not the std), or 1e-6 if flat
+        present = ~np.isnan(arr)
+        counts = present.sum(axis=0)
+        sq_dev = np.where(present, (arr - med) ** 2, 0.0).sum(axis=0)
+        rms = np.sqrt(sq_dev / np.maximum(counts, 1))
+        scale = np.where(mad > 0, mad * 1.4826, np.where(rms > 0, rms, 1e-6))
+        z = (current - med) / scale
+    return np.where((counts >= 5) & ~np.isnan(current), z, 0.0)
+
+
+# window length -> (xs, xs - x_mean, x_var); the same few lengths recur every tick
+_XS_CACHE: Dict[int, Tuple[np.ndarray, np.ndarray, float]] = {}
+
+
+def _xs_for(n: int) -> Tuple[np.ndarray, np.ndarray, float]:
+    cached = _XS_CACHE.get(n)
+    if cached is None:
+        xs = np.arange(n, dtype=np.float64)
+        dx = xs - xs.mean()
+        cached = _XS_CACHE[n] = (xs, dx, float((dx ** 2).sum()) or 1e-6)
+    return cached
+
+
+def _slope_vector(arr: np.ndarray, window: int = TREND_WINDOW) -> np.ndarray:
+    """Least-squares slope per column over the last `window` rows.
+
+    Missing values are dropped and the remaining ones paired with x = 0, 1, ...
+    in order, while x_mean/x_var cover the whole window.
+    """
+    n_feats = arr.shape[1]
+    if arr.shape[0] < 2:
+        return np.zeros(n_feats)
+    win = arr[-window:]
+    xs, dx, x_var = _xs_for(win.shape[0])
+    # Stable sort on isnan moves each column's present values to the top, in order
+    missing = np.isnan(win)
+    compact = np.take_along_axis(win, np.argsort(missing, axis=0, kind="stable"), axis=0)
+    counts = (~missing).sum(axis=0)
+    used = xs[:, None] < counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y_mean = np.where(used, compact, 0.0).sum(axis=0) / counts
+        cov = dx @ np.where(used, compact - y_mean, 0.0)
+    return np.where(counts >= 2, cov / x_var, 0.0)
+
+
+def _features_from_matrix(current: np.ndarray, arr: np.ndarray, features: List[str]) -> FeatureVector:
+    """z-scores, trend slopes and abnormal count from one pass over the history matrix."""
+    if NUMBA_AVAILABLE:
+        z, slopes, abnormal = features_nb(arr, current, TREND_WINDOW)
+    else:
+        z = _z_vector(current, arr)
+        slopes = _slope_vector(arr)
+        abnormal = int(np.count_nonzero(np.abs(z) >= 2.5))
+    return FeatureVector(
+        z_scores=dict(zip(features, z.tolist())),
+        trend_slopes=dict(zip(features, slopes.tolist())),
+        abnormal_count=abnormal,
+    )
 
 
 def extract_features(reading: Dict, history: List[Dict], features: List[str]) -> FeatureVector:
-    zs = _z_scores(reading, history, features)
-    slopes = _trend_slopes(history, features)
-    abnormal = sum(1 for z in zs.values() if abs(z) >= 2.5)
-    return FeatureVector(z_scores=zs, trend_slopes=slopes, abnormal_count=abnormal)
+    return _features_from_matrix(_reading_vector(reading, features), _history_matrix(history, features), features)
+
+
+def _inputs_key(reading: Dict, history: Union[List[Dict], NodeHistory], features: List[str], flags: Dict[str, bool]) -> Optional[Tuple]:
+    """Identity of a compute_node call's inputs, or None if rows carry no ids.
+
+    History windows hold rows with increasing ids, so first id, last id and
+    length pin down the window without comparing values.
+    """
+    if isinstance(history, NodeHistory):
+        ids = history.row_ids
+        if not len(ids) or ids[0] < 0 or ids[-1] < 0:
+            return None
+        first, last = int(ids[0]), int(ids[-1])
+    else:
+        if not history:
+            return None
+        first, last = history[0].get("id"), history[-1].get("id")
+        if first is None or last is None:
+            return None
+    return (
+        first,
+        last,
+        len(history),
+        tuple(features),
+        tuple(reading.get(f) for f in features),
+        tuple(sorted(flags.items())),
+    )
+
+
+def _iso_utc(epoch: int) -> str:
+    return datetime.utcfromtimestamp(epoch).isoformat() + "Z"
+
+
+def _jump_value(v) -> float:
+    if v is None:
+        return np.nan
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
 
 
 def detect_jumps(history: List[Dict], features: List[str]) -> Tuple[List[str], str | None]:
     if len(history) < 2:
         return [], None
-    prev = history[-2]
-    curr = history[-1]
+    prev_vec = np.array([_jump_value(history[-2].get(f)) for f in features], dtype=np.float64)
+    curr_vec = np.array([_jump_value(history[-1].get(f)) for f in features], dtype=np.float64)
+    return detect_jumps_vec(prev_vec, curr_vec, features)
+
+
+def detect_jumps_vec(prev_vec: np.ndarray, curr_vec: np.ndarray, features: Sequence[str]) -> Tuple[List[str], str | None]:
+    """Jumps of >= 5x between two readings given as feature vectors (NaN = missing).
+
+    Only a radiation_cpm jump sets a level: danger at >= 10x, else warning.
+    """
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        ratio = np.where(prev_vec > 0, curr_vec / prev_vec, 0.0)
     reasons: List[str] = []
     level: str | None = None
-    for feat in features:
-        a = prev.get(feat)
-        b = curr.get(feat)
-        if a is None or b is None:
-            continue
-        try:
-            a_f = float(a)
-            b_f = float(b)
-        except (TypeError, ValueError):
-            continue
-        if a_f <= 0:
-            continue
-        ratio = b_f / a_f
-        if ratio >= 5.0:
-            reasons.append(f"{feat} jump {a_f:.2f} -> {b_f:.2f} ({ratio:.1f}x)")
-            if feat == "radiation_cpm":
-                level = "danger" if ratio >= 10.0 else "warning"
+    for j in np.flatnonzero(ratio >= 5.0).tolist():
+        feat = features[j]
+        a_f, b_f, r = float(prev_vec[j]), float(curr_vec[j]), float(ratio[j])
+        reasons.append(f"{feat} jump {a_f:.2f} -> {b_f:.2f} ({r:.1f}x)")
+        if feat == "radiation_cpm":
+            level = "danger" if r >= 10.0 else "warning"
     return reasons, level
 
 
+# (status, confidence, summary) by how many of the 2.5 / 3.0 / 4.0 z thresholds are met
+_TIERS = (
+    ("Safe", 0.4, "Within expected ranges"),
+    ("ABNORMAL", 0.55, "Unusual pattern versus baseline"),
+    ("Warning", 0.6, "Elevated deviation from baseline"),
+    ("Danger", 0.8, "Major deviation from baseline"),
+)
+# Node status -> risk score for the overall aggregate; anything else scores 0.2
+_STATUS_SCORES = {"Danger": 1.0, "Warning": 0.7, "Offline": 0.6, "ABNORMAL": 0.5}
+# Weather-like features: a major deviation either way is unusual, not dangerous
+_BENIGN_FEATURES = frozenset({"air_temp_c", "pressure_hpa", "humidity"})
+
+
+def _classify_tier(z_abs: float, feat: str | None = None) -> Tuple[str, float, str]:
+    """(status, confidence, summary) for the most extreme |z|, from feature `feat`."""
+    tier = (z_abs >= 2.5) + (z_abs >= 3.0) + (z_abs >= 4.0)
+    if tier == 3 and feat in _BENIGN_FEATURES:
+        tier = 1
+    return _TIERS[tier]
+
+
 def ai_interpretation(features: FeatureVector, jump_reasons: List[str] | None = None, jump_level: str | None = None) -> Interpretation:
     """AI interpretation placeholder; deterministic fallback for now."""
-    benign_low = {"air_temp_c", "pressure_hpa", "humidity"}
-    benign_high = {"air_temp_c", "pressure_hpa", "humidity"}
     reasons: List[str] = []
-    status = "Safe"
-    confidence = 0.4
-    summary = "Within expected ranges"
-
-    z_items = list(features.z_scores.items())
-    z_max = max((abs(z) for _, z in z_items), default=0.0)
-    most_extreme = max(z_items, key=lambda item: abs(item[1]), default=(None, 0.0))
-    extreme_feat, extreme_z = most_extreme
-    if z_max >= 4.0:
-        if (extreme_feat in benign_low and extreme_z < 0) or (extreme_feat in benign_high and extreme_z > 0):
-            status = "ABNORMAL"
-            confidence = 0.55
-            summary = "Unusual pattern versus baseline"
-        else:
-            status = "Danger"
-            confidence = 0.8
-            summary = "Major deviation from baseline"
-    elif z_max >= 3.0:
-        status = "Warning"
-        confidence = 0.6
-        summary = "Elevated deviation from baseline"
-    elif z_max >= 2.5:
-        status = "ABNORMAL"
-        confidence = 0.55
-        summary = "Unusual pattern versus baseline"
-
-    for feat, z in sorted(features.z_scores.items(), key=lambda item: abs(item[1]), reverse=True):
+    # Only the three most extreme features can become reasons; nlargest is stable like sorted()
+    top = heapq.nlargest(3, features.z_scores.items(), key=lambda item: abs(item[1]))
+    extreme_feat, extreme_z = top[0] if top else (None, 0.0)
+    status, confidence, summary = _classify_tier(abs(extreme_z), extreme_feat)
+
+    for feat, z in top:
         if abs(z) < 2.5:
-            continue
+            break
         direction = "high" if z >= 0 else "low"
         reasons.append(f"{feat} {direction} vs baseline (z={z:.2f})")
-        if len(reasons) >= 3:
-            break
 
     if jump_reasons:
         reasons = jump_reasons + reasons
@@ -191,6 +380,55 @@ class StatusEngine:
     def __init__(self, config: AppConfig) -> None:
         self._config = config
         self._cache = StatusCache(node_status={}, overall={}, computed_at_epoch=0)
+        # Held for compute_node/compute_overall/recompute, so an ingest's background
+        # recompute and a status poll's recompute never interleave their updates
+        self._lock = threading.RLock()
+        # node_id -> columnar history, kept in sync with the history lists passed to compute_node
+        self._histories: Dict[NodeId, NodeHistory] = {}
+        # node_id -> (inputs key, status before hysteresis, result) of the last compute_node
+        self._last_inputs: Dict[NodeId, Tuple[Optional[Tuple], str, NodeStatus]] = {}
+        # feature list -> the same list without pm25, for nodes with the pm25 flag
+        self._pm25_free: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        # (node statuses, overall dict) of the last compute_overall
+        self._overall: Optional[Tuple[Tuple[str, ...], Dict]] = None
+
+    def _node_matrix(self, node_id: str, history: List[Dict], features: List[str]) -> np.ndarray:
+        """History matrix for node_id, parsing only rows added since the last call.
+
+        History is a sliding window of rows with increasing ids, so the node's
+        NodeHistory drops the rows that left the window and appends the new tail.
+        Called with self._lock held.
+        """
+        key = tuple(features)
+        ids = [row.get("id") for row in history]
+        if None in ids:
+            return _history_matrix(history, features)
+        node_hist = self._histories.get(node_id)
+        synced = False
+        if node_hist is not None and node_hist.features == key and ids:
+            cached_ids = node_hist.row_ids
+            start = int(np.searchsorted(cached_ids, ids[0]))
+            overlap = len(cached_ids) - start
+            if (
+                start < len(cached_ids)
+                and overlap <= len(ids)
+                and np.array_equal(cached_ids[start:], ids[:overlap])
+            ):
+                node_hist.drop_front(start)
+                node_hist.extend(history[overlap:])
+                synced = True
+        if not synced:
+            node_hist = NodeHistory.from_rows(node_id, history, features)
+        self._histories[node_id] = node_hist
+        return node_hist.matrix.copy()
+
+    def _without_pm25(self, features: Sequence[str]) -> Tuple[str, ...]:
+        # Keyed by value: id() of a caller's list can be reused once it's freed
+        key = tuple(features)
+        filtered = self._pm25_free.get(key)
+        if filtered is None:
+            filtered = self._pm25_free[key] = tuple(f for f in key if f != "pm25")
+        return filtered
 
     def _apply_hysteresis(self, node_id: str, new_status: str, now: int, override: bool) -> str:
         if override:
@@ -207,72 +445,119 @@ class StatusEngine:
             return prev.status
         return new_status
 
-    def compute_node(self, node_id: str, reading: Dict, history: List[Dict], features: List[str], flags: Dict[str, bool]) -> NodeStatus:
-        if flags.get(self._config.behavior.pm25_flag_name):
-            features = [f for f in features if f != "pm25"]
-        feats = extract_features(reading, history, features)
-        jump_reasons, jump_level = detect_jumps(history, features)
-        override_hysteresis = bool(jump_reasons) or max((abs(z) for z in feats.z_scores.values()), default=0.0) >= 4.0
-        interp = ai_interpretation(feats, jump_reasons, jump_level)
-        now = int(time.time())
-        status = self._apply_hysteresis(node_id, interp.status, now, override_hysteresis)
-        computed_at = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-        return NodeStatus(
-            node_id=node_id,
-            status=status,
-            confidence=interp.confidence,
-            reasons=interp.reasons,
-            summary=interp.summary,
-            computed_at=computed_at,
-            latest=reading,
-            flags=flags,
-        )
-
-    def compute_overall(self, node_results: Dict[NodeId, NodeStatus]) -> Dict:
-        now = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
-        if not node_results:
-            return {"status": "NO_DATA_YET", "confidence": 0.0, "reasons": [], "summary": "No data", "computed_at": now}
-        # aggregate deterministically (not worst-node)
-        scores = []
-        for node in node_results.values():
-            if node.status == "Danger":
-                scores.append(1.0)
-            elif node.status == "Warning":
-                scores.append(0.7)
-            elif node.status == "ABNORMAL":
-                scores.append(0.5)
-            elif node.status == "Offline":
-                scores.append(0.6)
+    def compute_node(
+        self,
+        node_id: str,
+        reading: Dict,
+        history: Union[List[Dict], NodeHistory],
+        features: List[str],
+        flags: Dict[str, bool],
+        computed_at: Optional[str] = None,
+        now: Optional[int] = None,
+    ) -> NodeStatus:
+        with self._lock:
+            if now is None:
+                now = int(time.time())
+            if flags.get(self._config.behavior.pm25_flag_name):
+                features = self._without_pm25(features)
+            key = _inputs_key(reading, history, features, flags)
+            prev = self._cache.node_status.get(node_id)
+            last = self._last_inputs.get(node_id)
+            # Same window and reading as the compute that produced prev, and hysteresis
+            # wasn't holding it back: recomputing would return the same status
+            if (
+                key is not None
+                and prev is not None
+                and last is not None
+                and last[0] == key
+                and last[2] is prev
+                and last[1] == prev.status
+            ):
+                result = replace(prev, computed_at=computed_at or _iso_utc(now), latest=reading, flags=flags)
+                # The new result is what lands in the cache, so the next tick can match it too
+                self._last_inputs[node_id] = (key, last[1], result)
+                return result
+            if isinstance(history, NodeHistory):
+                # Caller keeps the columns up to date; nothing to parse
+                mat = history.columns(features)
             else:
-                scores.append(0.2)
-        avg = sum(scores) / len(scores)
-        features = FeatureVector(
-            z_scores={"aggregate_score": avg * 4.0},
-            trend_slopes={},
-            abnormal_count=sum(1 for s in scores if s >= 0.5),
-        )
-        interp = ai_interpretation(features)
-        return {
-            "status": interp.status,
-            "confidence": min(1.0, max(interp.confidence, avg)),
-            "reasons": interp.reasons + [f"Aggregate risk score {avg:.2f} from {len(scores)} nodes"],
-            "summary": interp.summary,
-            "computed_at": now,
-        }
-
-    def recompute(self, node_histories: Dict[NodeId, List[Dict]], node_features: Dict[NodeId, List[str]], node_flags: Dict[NodeId, Dict[str, bool]]) -> StatusCache:
-        now = int(time.time())
-        node_results: Dict[NodeId, NodeStatus] = {}
-        for node_id, history in node_histories.items():
-            if not history:
-                continue
-            latest = history[-1]
-            features = node_features.get(node_id, [])
-            flags = node_flags.get(node_id, {})
-            node_results[node_id] = self.compute_node(node_id, latest, history, features, flags)
-        overall = self.compute_overall(node_results)
-        self._cache = StatusCache(node_status=node_results, overall=overall, computed_at_epoch=now)
-        return self._cache
+                mat = self._node_matrix(node_id, history, features)
+            feats = _features_from_matrix(_reading_vector(reading, features), mat, features)
+            jump_reasons, jump_level = detect_jumps_vec(mat[-2], mat[-1], features) if len(mat) >= 2 else ([], None)
+            override_hysteresis = bool(jump_reasons) or max((abs(z) for z in feats.z_scores.values()), default=0.0) >= 4.0
+            interp = ai_interpretation(feats, jump_reasons, jump_level)
+            status = self._apply_hysteresis(node_id, interp.status, now, override_hysteresis)
+            if computed_at is None:
+                computed_at = _iso_utc(now)
+            result = NodeStatus(
+                node_id=node_id,
+                status=status,
+                confidence=interp.confidence,
+                reasons=interp.reasons,
+                summary=interp.summary,
+                computed_at=computed_at,
+                latest=reading,
+                flags=flags,
+            )
+            self._last_inputs[node_id] = (key, interp.status, result)
+            return result
+
+    def compute_overall(self, node_results: Dict[NodeId, NodeStatus], computed_at: Optional[str] = None) -> Dict:
+        with self._lock:
+            now = computed_at or _iso_utc(int(time.time()))
+            if not node_results:
+                return {"status": "NO_DATA_YET", "confidence": 0.0, "reasons": [], "summary": "No data", "computed_at": now}
+            # The aggregate depends only on the node statuses in order; reuse it while they hold
+            signature = tuple(node.status for node in node_results.values())
+            if self._overall is not None and self._overall[0] == signature:
+                cached = self._overall[1]
+                return {**cached, "reasons": list(cached["reasons"]), "computed_at": now}
+            # aggregate deterministically (not worst-node)
+            scores = np.fromiter(
+                (_STATUS_SCORES.get(status, 0.2) for status in signature), dtype=np.float64, count=len(signature)
+            )
+            avg = float(scores.sum()) / len(scores)
+            # Same classification ai_interpretation gives a lone "aggregate_score" feature
+            z = avg * 4.0
+            status, confidence, summary = _classify_tier(z)
+            reasons = [f"aggregate_score high vs baseline (z={z:.2f})"] if z >= 2.5 else ["Within expected ranges"]
+            overall = {
+                "status": status,
+                "confidence": min(1.0, max(confidence, avg)),
+                "reasons": reasons + [f"Aggregate risk score {avg:.2f} from {len(scores)} nodes"],
+                "summary": summary,
+                "computed_at": now,
+            }
+            self._overall = (signature, {**overall, "reasons": list(overall["reasons"])})
+            return overall
+
+    def recompute(
+        self,
+        node_histories: Dict[NodeId, Union[List[Dict], NodeHistory]],
+        node_features: Dict[NodeId, List[str]],
+        node_flags: Dict[NodeId, Dict[str, bool]],
+        merge: bool = False,
+    ) -> StatusCache:
+        """Recompute the given nodes and the overall status.
+
+        With merge=True the results update the cached statuses of other nodes
+        instead of replacing them, for callers that recompute a single node.
+        """
+        with self._lock:
+            now = int(time.time())
+            # One timestamp string shared by every node and the overall status
+            computed_at = _iso_utc(now)
+            node_results: Dict[NodeId, NodeStatus] = dict(self._cache.node_status) if merge else {}
+            for node_id, history in node_histories.items():
+                if not history:
+                    continue
+                latest = history.row(-1) if isinstance(history, NodeHistory) else history[-1]
+                features = node_features.get(node_id, [])
+                flags = node_flags.get(node_id, {})
+                node_results[node_id] = self.compute_node(node_id, latest, history, features, flags, computed_at, now)
+            overall = self.compute_overall(node_results, computed_at)
+            self._cache = StatusCache(node_status=node_results, overall=overall, computed_at_epoch=now)
+            return self._cache
 
     @property
     def cache(self) -> StatusCache:
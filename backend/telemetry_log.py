@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import orjson
+
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryLogWriter:
+    """Append JSON lines from a background thread that keeps the file open.
+
+    Request handlers only enqueue; the writer drains the queue in batches and
+    flushes once per batch instead of opening/closing the file per record.
+    """
+
+    def __init__(self, path: Path, maxsize: int = 10000, batch_size: int = 100, flush_interval: float = 0.5) -> None:
+        self._path = path
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=maxsize)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        atexit.register(self.close)
+
+    def write(self, record: Dict) -> bool:
+        """Queue one record; returns False (record dropped) if the queue is full.
+
+        Callers should treat False as backpressure and shed load instead of retrying inline.
+        Raises orjson.JSONEncodeError if the record can't be serialized, which a retry won't fix.
+        """
+        line = orjson.dumps(record)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            logger.warning("Telemetry log queue full; dropping record")
+            return False
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Drain pending records and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        # Threads don't survive fork, so (re)start per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="telemetry-log", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        # Flushed when the queue drains or goes idle, so a large buffer only saves syscalls
+        with open(self._path, "ab", buffering=1 << 20) as handle:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self._flush_interval)
+                except queue.Empty:
+                    # Idle: push out anything written since the last flush
+                    handle.flush()
+                    continue
+                batch: List[bytes] = []
+                stop = first is None
+                if not stop:
+                    batch.append(first)
+                while not stop and len(batch) < self._batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                    else:
+                        batch.append(item)
+                if batch:
+                    handle.write(b"\n".join(batch) + b"\n")
+                    # Under sustained load keep filling the buffer; flush once the queue drains
+                    if self._queue.empty():
+                        handle.flush()
+                if stop:
+                    return
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "readings.db")
+    db.init_db()
+    return db.DB_PATH
+
+
+def _reading(ts, cpm=10.0):
+    return {"ts": ts, "node_id": "ground_1", "radiation_cpm": cpm}
+
+
+def _insert_in_thread(results, name, reading):
+    def run():
+        try:
+            results[name] = db.insert_reading(reading)
+        except Exception as exc:
+            results[name] = exc
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_insert_reading_returns_row_id_and_updates_history(fresh_db):
+    first = db.insert_reading(_reading("2026-01-01T00:00:00Z", 10.0))
+    second = db.insert_reading(_reading("2026-01-01T00:00:10Z", 11.0))
+    assert second > first
+    history = db.get_history("ground_1")
+    assert [row["id"] for row in history] == [first, second]
+    assert db.get_latest("ground_1")["radiation_cpm"] == 11.0
+
+
+def test_unbindable_row_fails_alone(fresh_db):
+    # Hold the write lock so the writer queues the next readings into one batch
+    blocker = sqlite3.connect(fresh_db, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    results = {}
+    try:
+        db.insert_reading(_reading("2026-01-01T00:00:00Z"), wait=False)
+        time.sleep(0.2)
+        threads = [
+            _insert_in_thread(results, "bad", _reading(2 ** 63)),
+            _insert_in_thread(results, "good", _reading("2026-01-01T00:00:10Z")),
+        ]
+        time.sleep(0.2)
+    finally:
+        blocker.execute("COMMIT")
+        blocker.close()
+    for thread in threads:
+        thread.join(10)
+    assert isinstance(results["bad"], OverflowError)
+    assert isinstance(results["good"], int)
+    assert db._writer["thread"].is_alive()
+    assert [row["ts"] for row in db.get_history("ground_1")] == ["2026-01-01T00:00:00Z", "2026-01-01T00:00:10Z"]
+
+
+def test_insert_reading_times_out(fresh_db, monkeypatch):
+    monkeypatch.setattr(db, "WRITE_WAIT_TIMEOUT", 0.1)
+    blocker = sqlite3.connect(fresh_db, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(TimeoutError):
+            db.insert_reading(_reading("2026-01-01T00:00:00Z"))
+    finally:
+        blocker.execute("COMMIT")
+        blocker.close()
+    db.flush_writes()
+    assert len(db.get_history("ground_1")) == 1
+
+
+def test_history_matches_stored_types(fresh_db):
+    db.insert_reading({"ts": 1760000000, "node_id": "ground_1", "radiation_cpm": 12})
+    latest = db.get_latest("ground_1")
+    assert latest == db.get_recent(1, node_id="ground_1")[0]
+    assert latest["ts"] == "1760000000"
+    assert latest["radiation_cpm"] == 12.0 and isinstance(latest["radiation_cpm"], float)
@@ -0,0 +1,83 @@
+import numpy as np
+
+import status_engine
+from config import AppConfig, SecurityConfig, NodeBehaviorConfig, StatusConfig
+from status_engine import NodeHistory, StatusEngine
+
+FEATURES = ["radiation_cpm", "pm25"]
+
+
+def _rows(start, n):
+    return [
+        {"id": i, "node_id": "ground_1", "ts": f"t{i}", "radiation_cpm": 10.0 + i % 3, "pm25": None if i % 4 == 0 else float(i)}
+        for i in range(start, start + n)
+    ]
+
+
+def _engine():
+    cfg = AppConfig(
+        security=SecurityConfig(hmac_secrets={}),
+        behavior=NodeBehaviorConfig(disable_pm25_nodes=set()),
+        status=StatusConfig(),
+    )
+    return StatusEngine(cfg)
+
+
+def test_rows_round_trip():
+    rows = _rows(1, 5)
+    hist = NodeHistory.from_rows("ground_1", rows, FEATURES)
+    assert len(hist) == 5
+    assert hist.row_ids.tolist() == [1, 2, 3, 4, 5]
+    assert hist.to_list_of_dicts() == rows
+    assert hist.row(-1) == rows[-1]
+
+
+def test_sliding_window_keeps_order():
+    hist = NodeHistory.from_rows("ground_1", _rows(1, 20), FEATURES)
+    for i in range(21, 121):
+        hist.append(_rows(i, 1)[0])
+        hist.drop_front(1)
+    assert hist.to_list_of_dicts() == _rows(101, 20)
+    assert hist.columns(["pm25"]).shape == (20, 1)
+
+
+def test_compute_node_same_for_list_and_node_history():
+    rows = _rows(1, 50)
+    rows[-1]["radiation_cpm"] = 200.0
+    from_list = _engine().compute_node("ground_1", rows[-1], rows, FEATURES, {}, "now")
+    hist = NodeHistory.from_rows("ground_1", rows, FEATURES)
+    from_columns = _engine().compute_node("ground_1", hist.row(-1), hist, FEATURES, {}, "now")
+    assert from_columns.status == from_list.status
+    assert from_columns.reasons == from_list.reasons
+    assert from_columns.confidence == from_list.confidence
+
+
+def test_numba_and_numpy_features_agree(monkeypatch):
+    rng = np.random.default_rng(7)
+    arr = rng.normal(10.0, 2.0, size=(40, 4))
+    arr[rng.random(arr.shape) < 0.2] = np.nan
+    arr[:, 2] = 3.0  # constant column: MAD of zero
+    arr[:-2, 3] = np.nan  # too few values for a z-score
+    current = np.array([25.0, np.nan, 3.0, 9.0])
+    features = ["a", "b", "c", "d"]
+    results = []
+    for available in (True, False):
+        monkeypatch.setattr(status_engine, "NUMBA_AVAILABLE", available)
+        results.append(status_engine._features_from_matrix(current, arr, features))
+    from_numba, from_numpy = results
+    assert from_numba.z_scores == from_numpy.z_scores
+    assert from_numba.trend_slopes == from_numpy.trend_slopes
+    assert from_numba.abnormal_count == from_numpy.abnormal_count
+
+
+def test_unchanged_inputs_skip_feature_extraction(monkeypatch):
+    calls = []
+    extract = status_engine._features_from_matrix
+    monkeypatch.setattr(status_engine, "_features_from_matrix", lambda *args: calls.append(1) or extract(*args))
+    engine = _engine()
+    history = _rows(1, 30)
+    for _ in range(6):
+        engine.recompute({"ground_1": history}, {"ground_1": FEATURES}, {"ground_1": {}})
+    assert len(calls) == 1
+    engine.recompute({"ground_1": history + _rows(31, 1)}, {"ground_1": FEATURES}, {"ground_1": {}})
+    assert len(calls) == 2
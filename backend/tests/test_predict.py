@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+import pytest
+
+from ai import predict
+from ai.predict import StabilityAccumulator
+
+
+def test_z_scores_known_values():
+    history = [{"pm25": v, "voc": None if v > 2 else v} for v in [1.0, 2.0, 3.0, 4.0, 5.0]]
+    zs = predict._z_scores({"pm25": 8.0, "voc": 9.0}, history, ["pm25", "voc"])
+    # median 3, MAD 1; voc has fewer than three values
+    assert zs["pm25"] == pytest.approx(5.0 / 1.4826)
+    assert zs["voc"] == 0.0
+    assert predict._z_scores({"pm25": 8.0}, [], ["pm25"]) == {"pm25": 0.0}
+
+
+def test_partition_medians_even_counts_and_std_fallback():
+    history = [{"pm25": v, "voc": w} for v, w in [(4.0, 2.0), (None, 2.0), (1.0, 2.0), (3.0, 2.0), (2.0, 10.0)]]
+    zs = predict._z_scores({"pm25": 5.0, "voc": 5.0}, history, ["pm25", "voc"])
+    # pm25: four values, median 2.5 and MAD 1
+    assert zs["pm25"] == pytest.approx(2.5 / 1.4826)
+    # voc: MAD is 0, so the population std (3.2) is the scale
+    assert zs["voc"] == pytest.approx(3.0 / 3.2)
+
+
+def test_check_hard_limits_known_values():
+    reading = {"radiation_cpm": 600.0, "pm25": None, "humidity": 5.0, "voc": 100.0}
+    danger_hit, warn_hit, reasons, flagged, warn_features = predict._check_hard_limits(reading, "ground")
+    assert (danger_hit, warn_hit) == (True, True)
+    assert reasons == [
+        "Absolute threshold exceeded: radiation_cpm 600.0 >= 500",
+        "High reading: radiation_cpm 600.0 >= 120",
+        "Absolute threshold exceeded: humidity 5.0 <= 10",
+    ]
+    assert [(f["feature"], f["threshold"], f["direction"]) for f in flagged] == [
+        ("radiation_cpm", 500, "high"),
+        ("radiation_cpm", 120, "high"),
+        ("humidity", 10, "low"),
+    ]
+    assert warn_features == {"radiation_cpm"}
+
+
+def test_check_hard_limits_water_warning_low():
+    danger_hit, warn_hit, reasons, _, warn_features = predict._check_hard_limits({"ph": 6.2, "tds": 100.0}, "water")
+    assert (danger_hit, warn_hit) == (False, True)
+    assert reasons == ["Low reading: ph 6.2 <= 6.5"]
+    assert warn_features == {"ph"}
+    assert predict._check_hard_limits({}, "water")[:3] == (False, False, [])
+
+
+def _score(z, warn_features=0, warn_hard=False, danger_hard=False, jump_warn=False, jump_danger=False,
+           iso_prob=0.0, baseline_prob=0.0, history_len=100):
+    return predict._score_core(np.array(z, dtype=np.float64), warn_features, warn_hard, danger_hard,
+                               jump_warn, jump_danger, iso_prob, baseline_prob, history_len)
+
+
+def test_score_core_known_values():
+    prob, warn_hit, danger_hit, abnormal = _score([3.0, -2.6, 0.1], baseline_prob=0.4)
+    assert prob == pytest.approx(0.55)
+    assert (warn_hit, danger_hit, abnormal) == (False, False, 2)
+    prob, warn_hit, danger_hit, abnormal = _score([3.0, -2.6, 2.5], warn_features=1, baseline_prob=0.4)
+    assert prob == pytest.approx(0.65)
+    assert abnormal == 4
+    prob, _, danger_hit, _ = _score([0.0], jump_danger=True)
+    assert (prob, danger_hit) == (0.85, True)
+    prob, _, danger_hit, _ = _score([0.0], danger_hard=True, iso_prob=0.2)
+    assert (prob, danger_hit) == (0.99, True)
+
+
+def test_score_core_low_history_forces_warning():
+    prob, warn_hit, danger_hit, _ = _score([0.0], warn_hard=True, history_len=10)
+    assert (prob, warn_hit, danger_hit) == (0.5, True, False)
+
+
+def _rows(values, start=1):
+    return [{"id": i, "pm25": v} for i, v in enumerate(values, start=start)]
+
+
+def test_stability_accumulator_known_values():
+    acc = StabilityAccumulator.from_history(_rows([10.0, 12.0, 14.0, 16.0, 18.0]), ["pm25"])
+    assert acc.n == 5
+    assert acc.total == 70.0
+    # mean 14, population std sqrt(8): cv ~0.202
+    assert acc.factor() == pytest.approx(1.0 - math.sqrt(8.0) / 14.0)
+    flat = StabilityAccumulator.from_history(_rows([5.0] * 10), ["pm25"])
+    assert flat.factor() == 1.0
+    assert StabilityAccumulator.from_history(_rows([1.0, 2.0]), ["pm25"]).factor() == 1.0
+
+
+def test_stability_factor_rebuilds_when_window_shrinks():
+    predict._STABILITY.clear()
+    long_history = _rows([float(v % 7 + 1) for v in range(40)])
+    predict._stability_factor(long_history, ["pm25"], window=50, node_id="ground_1")
+    # Same tail ids, but the window now only holds the last 6 rows plus one new one
+    short_history = long_history[-6:] + _rows([3.0], start=41)
+    factor = predict._stability_factor(short_history, ["pm25"], window=50, node_id="ground_1")
+    assert factor == StabilityAccumulator.from_history(short_history, ["pm25"]).factor()
+    assert len(predict._STABILITY[("ground_1", ("pm25",), 50)]) == 7
+
+
+def test_stability_accumulator_sliding_matches_fresh():
+    values = [1e6 + (v * 37 % 11) * 0.1 for v in range(500)]
+    acc = StabilityAccumulator(window=50)
+    for row in _rows(values):
+        acc.push(row["id"], row, ["pm25"])
+    fresh = StabilityAccumulator.from_history(_rows(values), ["pm25"])
+    assert acc.n == fresh.n
+    assert acc.total == fresh.total
+    assert acc.total_sq == fresh.total_sq
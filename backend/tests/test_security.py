@@ -1,3 +1,4 @@
+import threading
 import time
 
 from config import SecurityConfig
@@ -49,3 +50,95 @@ def test_nonce_replay_detected():
     res2 = verify_signature(headers, body, cfg, cache)
     assert res1.ok
     assert not res2.ok
+
+
+def test_nonce_cache_evicts_oldest_at_capacity():
+    cache = NonceCache(ttl_sec=600, max_per_node=2)
+    now = int(time.time())
+    assert not cache.seen("ground_1", "n1", now)
+    assert not cache.seen("ground_1", "n2", now)
+    assert not cache.seen("ground_1", "n3", now)
+    # n1 was evicted to make room; n2 and n3 are still remembered
+    assert not cache.seen("ground_1", "n1", now)
+    assert cache.seen("ground_1", "n3", now)
+    # Capacity is per node
+    assert not cache.seen("ground_2", "n3", now)
+
+
+def test_nonce_cache_expires_after_ttl():
+    cache = NonceCache(ttl_sec=10)
+    now = int(time.time())
+    assert not cache.seen("ground_1", "old", now)
+    assert not cache.seen("ground_1", "newer", now + 5)
+    assert not cache.seen("ground_1", "old", now + 11)
+    assert cache.seen("ground_1", "newer", now + 11)
+
+
+def test_invalid_signature_does_not_record_nonce():
+    node_id = "ground_1"
+    secret = "s3cr3t"
+    ts = int(time.time())
+    nonce = "badsig"
+    body = b'{"device_id":"ground_1","timestamp":1,"data":{"pm25":1}}'
+    headers = {
+        "X-Node-Id": node_id,
+        "X-Timestamp": str(ts),
+        "X-Nonce": nonce,
+        "X-Signature": _sign("wrong", node_id, ts, nonce, body),
+    }
+    cfg = SecurityConfig(hmac_secrets={node_id: secret}, sig_window_sec=300, nonce_ttl_sec=600)
+    cache = NonceCache(cfg.nonce_ttl_sec)
+    res1 = verify_signature(headers, body, cfg, cache)
+    assert res1.error == "Invalid signature"
+    headers["X-Signature"] = _sign(secret, node_id, ts, nonce, body)
+    res2 = verify_signature(headers, body, cfg, cache)
+    assert res2.ok
+
+
+def test_same_nonce_from_two_threads_passes_once():
+    node_id = "ground_1"
+    secret = "s3cr3t"
+    body = b'{"device_id":"ground_1","timestamp":1,"data":{"pm25":1}}'
+    cfg = SecurityConfig(hmac_secrets={node_id: secret}, sig_window_sec=300, nonce_ttl_sec=600)
+    cache = NonceCache(cfg.nonce_ttl_sec)
+    for attempt in range(50):
+        ts = int(time.time())
+        nonce = f"race{attempt}"
+        headers = {
+            "X-Node-Id": node_id,
+            "X-Timestamp": str(ts),
+            "X-Nonce": nonce,
+            "X-Signature": _sign(secret, node_id, ts, nonce, body),
+        }
+        barrier = threading.Barrier(2)
+        results = []
+
+        def send():
+            barrier.wait()
+            results.append(verify_signature(headers, body, cfg, cache).ok)
+
+        threads = [threading.Thread(target=send) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == [False, True]
+
+
+def test_signature_must_be_lowercase_hex():
+    node_id = "ground_1"
+    secret = "s3cr3t"
+    ts = int(time.time())
+    body = b'{"device_id":"ground_1","timestamp":1,"data":{"pm25":1}}'
+    cfg = SecurityConfig(hmac_secrets={node_id: secret}, sig_window_sec=300, nonce_ttl_sec=600)
+    cache = NonceCache(cfg.nonce_ttl_sec)
+    for i, variant in enumerate([str.upper, lambda sig: sig[:2] + " " + sig[2:], lambda sig: sig[:-2]]):
+        nonce = f"hex{i}"
+        headers = {
+            "X-Node-Id": node_id,
+            "X-Timestamp": str(ts),
+            "X-Nonce": nonce,
+            "X-Signature": variant(_sign(secret, node_id, ts, nonce, body)),
+        }
+        res = verify_signature(headers, body, cfg, cache)
+        assert res.error == "Invalid signature"
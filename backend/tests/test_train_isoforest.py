@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+from scripts import train_isoforest
+
+FEATURES = ["pm25", "voc"]
+
+
+@pytest.fixture
+def train_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(train_isoforest, "DB_PATH", tmp_path / "readings.db")
+    monkeypatch.setattr(train_isoforest, "AI_DIR", tmp_path / "ai")
+    return tmp_path
+
+
+def _write_db(path, rows, fresh=False):
+    if fresh and path.exists():
+        path.unlink()
+    with sqlite3.connect(path) as con:
+        con.execute("CREATE TABLE IF NOT EXISTS readings (id INTEGER PRIMARY KEY, ts TEXT, node_id TEXT, pm25 REAL, voc REAL)")
+        con.executemany("INSERT INTO readings (ts, node_id, pm25, voc) VALUES (?, 'ground_1', ?, ?)", rows)
+
+
+def test_feature_cache_is_incremental(train_paths):
+    db_path = train_paths / "readings.db"
+    _write_db(db_path, [("t1", 1.0, 10.0), ("t2", 2.0, None)])
+    assert train_isoforest.load_features("ground", ["ground_1"], FEATURES).tolist() == [[1.0, 10.0]]
+    _write_db(db_path, [("t3", 3.0, 30.0)])
+    assert train_isoforest.load_features("ground", ["ground_1"], FEATURES).tolist() == [[1.0, 10.0], [3.0, 30.0]]
+
+
+def test_feature_cache_rebuilt_when_database_changes(train_paths):
+    db_path = train_paths / "readings.db"
+    _write_db(db_path, [("t1", 1.0, 10.0), ("t2", 2.0, 20.0)])
+    train_isoforest.load_features("ground", ["ground_1"], FEATURES)
+    # Recreated with as many rows, so the ids line up with the cached last_id
+    _write_db(db_path, [("u1", 5.0, 50.0), ("u2", 6.0, 60.0)], fresh=True)
+    assert train_isoforest.load_features("ground", ["ground_1"], FEATURES).tolist() == [[5.0, 50.0], [6.0, 60.0]]
@@ -0,0 +1,5 @@
+"""WSGI entry point for gunicorn: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Importing app runs init_db(), so the schema exists before any worker serves.
+"""
+from app import app  # noqa: F401